@@ -0,0 +1,46 @@
+from typing import FrozenSet, Optional, Type, TypeVar
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models.product import Candle
+
+Detail = TypeVar("Detail", bound=BaseModel)
+
+# ?expand= field -> eager loader. Collections use selectinload (one extra query each,
+# whatever the page size); the many-to-one category is joined into the main query.
+CANDLE_EXPANSIONS = {
+    "images": lambda: selectinload(Candle.images),
+    "tags": lambda: selectinload(Candle.tags),
+    "category": lambda: joinedload(Candle.category),
+}
+
+
+def parse_expand(expand: Optional[str]) -> FrozenSet[str]:
+    if not expand:
+        return frozenset()
+    fields = frozenset(field.strip() for field in expand.split(",") if field.strip())
+    unknown = fields - CANDLE_EXPANSIONS.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown expand field(s): {', '.join(sorted(unknown))}",
+        )
+    return fields
+
+
+def expand_options(fields: FrozenSet[str]) -> list:
+    return [CANDLE_EXPANSIONS[field]() for field in sorted(fields)]
+
+
+def candle_detail(candle: Candle, expand: FrozenSet[str], model: Type[Detail]) -> Detail:
+    """``candle`` as ``model`` with only the expanded relations filled in.
+
+    Relations that were not asked for are never read, so nothing is lazy-loaded per candle.
+    """
+    return model.model_validate({
+        name: getattr(candle, name)
+        for name in model.model_fields
+        if name not in CANDLE_EXPANSIONS or name in expand
+    }, from_attributes=True)
@@ -0,0 +1,258 @@
+"""Bulk catalog import from CSV or NDJSON.
+
+Rows are validated and upserted in chunks keyed on ``sku``; category and tag names are
+resolved through in-memory maps that are filled once and extended as new names appear.
+Invalid rows are reported and skipped, the rest of the file is still imported.
+
+    python -m app.catalog_import catalog.csv
+    python -m app.catalog_import catalog.ndjson --format ndjson
+"""
+import argparse
+import csv
+import json
+import re
+import sys
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO
+
+from pydantic import BaseModel, Field, ValidationError, validator
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.product import MAX_INT, MAX_PRICE, Candle, CandleImage, Category, Tag, candle_tags
+
+IMPORT_CHUNK_SIZE = 2000
+MAX_REPORTED_ERRORS = 1000
+IMPORT_FORMATS = ("csv", "ndjson")
+# Streams are decoded with errors="surrogateescape", which turns bytes that are not UTF-8 into
+# lone surrogates; rows holding them (or NUL bytes, which Postgres refuses) are reported
+TEXT_ERRORS = "surrogateescape"
+_UNSTORABLE = re.compile("[\x00\udc80-\udcff]")
+
+CANDLE_FIELDS = (
+    "name", "description", "price", "stock_quantity", "weight_grams",
+    "burn_time_hours", "color", "scent", "material",
+)
+
+
+class CandleImportRow(BaseModel):
+    sku: str = Field(min_length=1, max_length=64)
+    name: str = Field(max_length=150)
+    description: Optional[str] = None
+    price: float = Field(ge=0, le=MAX_PRICE)
+    stock_quantity: int = Field(ge=0, le=MAX_INT)
+    weight_grams: Optional[int] = Field(None, ge=0, le=MAX_INT)
+    burn_time_hours: Optional[int] = Field(None, ge=0, le=MAX_INT)
+    color: Optional[str] = Field(None, max_length=50)
+    scent: Optional[str] = Field(None, max_length=100)
+    material: Optional[str] = Field(None, max_length=100)
+    category: Optional[str] = Field(None, max_length=100)
+    tags: List[str] = []
+    image_urls: List[str] = []
+
+    @validator("*", pre=True)
+    def blank_to_none(cls, value):
+        return None if value == "" else value
+
+    @validator("tags", "image_urls", pre=True)
+    def split_list(cls, value):
+        # CSV cells hold lists as "a|b|c"
+        if value is None:
+            return []
+        if isinstance(value, str):
+            return [item.strip() for item in value.split("|") if item.strip()]
+        return value
+
+    @validator("tags")
+    def tag_length(cls, value):
+        if any(len(tag) > 50 for tag in value):
+            raise ValueError("tag names are at most 50 characters")
+        return value
+
+
+def read_records(stream: TextIO, file_format: str) -> Iterator:
+    """Records of ``stream``, which should be opened with ``errors=TEXT_ERRORS``."""
+    if file_format == "csv":
+        return iter(csv.DictReader(stream))
+    # NDJSON lines are decoded during validation so a bad line is reported like any other bad row
+    return (line for line in stream if line.strip())
+
+
+def _numbered(records: Iterable) -> Iterator[tuple]:
+    """(row number, record) pairs; a record that could not be read is the exception instead."""
+    records = iter(records)
+    row_number = 0
+    while True:
+        row_number += 1
+        try:
+            yield row_number, next(records)
+        except StopIteration:
+            return
+        except csv.Error as exc:
+            # e.g. a field over csv.field_size_limit(); the reader carries on with the next line
+            yield row_number, exc
+        except UnicodeDecodeError as exc:
+            # Only without TEXT_ERRORS; the decoder cannot resynchronise, so the rest is lost
+            yield row_number, ValueError(f"{exc}; the rest of the file was not read")
+            return
+
+
+def _unreadable(record) -> Optional[str]:
+    if isinstance(record, Exception):
+        return str(record)
+    values = record.values() if isinstance(record, dict) else [record]
+    if any(isinstance(value, str) and _UNSTORABLE.search(value) for value in values):
+        return "contains bytes that are not valid UTF-8, or a NUL byte"
+    return None
+
+
+def _name_map(db: Session, model) -> Dict[str, int]:
+    return {name: id_ for id_, name in db.execute(select(model.id, model.name))}
+
+
+def _resolve_names(db: Session, model, names: Iterable[str], known: Dict[str, int]) -> None:
+    missing = sorted(set(names) - known.keys())
+    if not missing:
+        return
+    db.execute(insert(model).values([{"name": name} for name in missing]).on_conflict_do_nothing())
+    known.update(
+        (name, id_) for id_, name in db.execute(select(model.id, model.name).where(model.name.in_(missing)))
+    )
+
+
+def _upsert_chunk(db: Session, rows: List[CandleImportRow], categories: Dict[str, int], tags: Dict[str, int]) -> int:
+    # Later rows win when a chunk repeats a SKU; Postgres refuses to upsert a row twice in one statement
+    rows = list({row.sku: row for row in rows}.values())
+    _resolve_names(db, Category, (row.category for row in rows if row.category), categories)
+    _resolve_names(db, Tag, (tag for row in rows for tag in row.tags), tags)
+
+    stmt = insert(Candle).values([
+        dict(
+            {field: getattr(row, field) for field in CANDLE_FIELDS},
+            sku=row.sku,
+            category_id=categories.get(row.category),
+        )
+        for row in rows
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Candle.sku],
+        set_={field: stmt.excluded[field] for field in CANDLE_FIELDS + ("category_id",)},
+    ).returning(Candle.id, Candle.sku)
+    candle_ids = {sku: id_ for id_, sku in db.execute(stmt)}
+
+    tag_links = [
+        {"candle_id": candle_ids[row.sku], "tag_id": tags[tag]}
+        for row in rows for tag in set(row.tags)
+    ]
+    if tag_links:
+        db.execute(insert(candle_tags).values(tag_links).on_conflict_do_nothing())
+    images = [
+        {"candle_id": candle_ids[row.sku], "image_url": url}
+        for row in rows for url in dict.fromkeys(row.image_urls)
+    ]
+    if images:
+        db.execute(insert(CandleImage).values(images).on_conflict_do_nothing())
+    return len(rows)
+
+
+def _reload_names(db: Session, categories: Dict[str, int], tags: Dict[str, int]) -> None:
+    # Names inserted by a rolled back transaction are gone again
+    categories.clear()
+    categories.update(_name_map(db, Category))
+    tags.clear()
+    tags.update(_name_map(db, Tag))
+
+
+def _upsert_rows(db: Session, rows: List[CandleImportRow], row_numbers: List[int],
+                 categories: Dict[str, int], tags: Dict[str, int], fail) -> int:
+    """Upsert a chunk that failed as a whole one row at a time, each under a SAVEPOINT.
+
+    Only the rows the database still rejects are reported; the others are imported.
+    """
+    upserted = 0
+    for row_number, row in zip(row_numbers, rows):
+        known = dict(categories), dict(tags)
+        try:
+            with db.begin_nested():
+                upserted += _upsert_chunk(db, [row], categories, tags)
+        except SQLAlchemyError as exc:
+            categories.clear()
+            categories.update(known[0])
+            tags.clear()
+            tags.update(known[1])
+            fail(row_number, [{"field": None, "message": str(getattr(exc, "orig", exc)).strip()}])
+    db.commit()
+    return upserted
+
+
+def import_catalog(db: Session, records: Iterable, chunk_size: int = IMPORT_CHUNK_SIZE) -> dict:
+    categories = _name_map(db, Category)
+    tags = _name_map(db, Tag)
+    report = {"processed": 0, "upserted": 0, "failed": 0, "errors": []}
+
+    def fail(row_number: int, errors: list):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"row": row_number, "errors": errors})
+
+    numbered = _numbered(records)
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        report["processed"] += len(chunk)
+        valid, valid_numbers = [], []
+        for row_number, record in chunk:
+            unreadable = _unreadable(record)
+            if unreadable:
+                fail(row_number, [{"field": None, "message": unreadable}])
+                continue
+            try:
+                if isinstance(record, str):
+                    record = json.loads(record)
+                valid.append(CandleImportRow.parse_obj(record))
+                valid_numbers.append(row_number)
+            except ValidationError as exc:
+                fail(row_number, [
+                    {"field": ".".join(str(loc) for loc in error["loc"]), "message": error["msg"]}
+                    for error in exc.errors()
+                ])
+            except ValueError as exc:
+                fail(row_number, [{"field": None, "message": str(exc)}])
+        if not valid:
+            continue
+        try:
+            report["upserted"] += _upsert_chunk(db, valid, categories, tags)
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            _reload_names(db, categories, tags)
+            report["upserted"] += _upsert_rows(db, valid, valid_numbers, categories, tags, fail)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Bulk import candles from a CSV or NDJSON file.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=IMPORT_FORMATS, default=None,
+                        help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+    file_format = args.format or ("ndjson" if args.path.endswith((".ndjson", ".jsonl")) else "csv")
+
+    db = SessionLocal()
+    try:
+        with open(args.path, newline="", encoding="utf-8-sig", errors=TEXT_ERRORS) as stream:
+            report = import_catalog(db, read_records(stream, file_format), args.chunk_size)
+    finally:
+        db.close()
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 1 if report["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
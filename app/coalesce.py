@@ -0,0 +1,71 @@
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable
+
+from fastapi import Response
+from fastapi.encoders import jsonable_encoder
+
+
+class SingleFlight:
+    """Collapses concurrent identical calls into one execution.
+
+    The first caller for a key runs the loader; callers arriving while it is still
+    running wait for it and receive the same serialized body.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Future] = {}
+        self.executions = 0
+        self.collapsed = 0
+
+    def do(self, key: Hashable, fn: Callable[[], bytes]) -> bytes:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = Future()
+                self.executions += 1
+            else:
+                self.collapsed += 1
+        if not leader:
+            return call.result()
+        try:
+            result = fn()
+        except BaseException as exc:
+            call.set_exception(exc)
+            raise
+        else:
+            call.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def response(self, key: Hashable, load: Callable[[], Any]) -> Response:
+        body = self.do(key, lambda: json.dumps(jsonable_encoder(load())).encode())
+        return Response(content=body, media_type="application/json")
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "executions": self.executions,
+            "collapsed": self.collapsed,
+            "in_flight": len(self._calls),
+        }
+
+
+_groups: Dict[str, SingleFlight] = {}
+
+
+def single_flight(name: str) -> SingleFlight:
+    group = _groups.get(name)
+    if group is None:
+        group = _groups.setdefault(name, SingleFlight(name))
+    return group
+
+
+def all_stats() -> list:
+    return [group.stats() for group in _groups.values()]
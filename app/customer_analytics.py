@@ -0,0 +1,118 @@
+from datetime import datetime, timedelta
+from typing import Dict
+
+import numpy as np
+from sqlalchemy import delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.models.user import CustomerSegment, Order
+
+# Frequency and monetary value count orders in this window; recency and lifetime value use all of them
+RFM_WINDOW = timedelta(days=365)
+RFM_BINS = 5
+SEGMENT_UPSERT_CHUNK = 5000
+
+# First matching rule wins. r, f and m are scores from 1 (worst) to 5 (best); orders is the raw
+# all-time order count, since ties can lift every one-order customer above the lowest f score
+SEGMENT_RULES = [
+    ("champions", lambda r, f, m, orders: (r >= 4) & (f >= 4) & (m >= 4)),
+    ("cant_lose", lambda r, f, m, orders: (r <= 2) & (f >= 4) & (m >= 4)),
+    ("loyal", lambda r, f, m, orders: (r >= 3) & (f >= 4)),
+    ("at_risk", lambda r, f, m, orders: (r <= 2) & (f >= 3)),
+    ("new", lambda r, f, m, orders: (r >= 4) & (orders <= 1)),
+    ("potential_loyalist", lambda r, f, m, orders: (r >= 3) & (f >= 2)),
+    ("lost", lambda r, f, m, orders: (r == 1) & (f <= 2)),
+    ("hibernating", lambda r, f, m, orders: r <= 2),
+]
+DEFAULT_SEGMENT = "need_attention"
+SEGMENTS = [name for name, _ in SEGMENT_RULES] + [DEFAULT_SEGMENT]
+
+
+def quantile_scores(values: np.ndarray, higher_is_better: bool = True) -> np.ndarray:
+    """1..RFM_BINS by quantile of ``values``.
+
+    Ties share their mid-rank, so e.g. the many one-order customers all get the same frequency score.
+    """
+    ordered = np.sort(values)
+    mid_rank = (np.searchsorted(ordered, values, side="left") + np.searchsorted(ordered, values, side="right")) / 2
+    bins = np.minimum((mid_rank / len(values) * RFM_BINS).astype(np.int64), RFM_BINS - 1)
+    return 1 + bins if higher_is_better else RFM_BINS - bins
+
+
+def segment_labels(r: np.ndarray, f: np.ndarray, m: np.ndarray, orders: np.ndarray) -> np.ndarray:
+    return np.select([rule(r, f, m, orders) for _, rule in SEGMENT_RULES], [name for name, _ in SEGMENT_RULES],
+                     default=DEFAULT_SEGMENT)
+
+
+def compute_segments(db: Session) -> int:
+    """Recompute RFM scores, segments and lifetime value for every customer with an order."""
+    now = datetime.utcnow()
+    window_start = now - RFM_WINDOW
+    in_window = Order.order_date >= window_start
+    rows = db.query(
+        Order.user_id,
+        func.min(Order.order_date),
+        func.max(Order.order_date),
+        func.count(Order.id),
+        func.count(Order.id).filter(in_window),
+        func.coalesce(func.sum(Order.total_amount).filter(in_window), 0),
+        func.coalesce(func.sum(Order.total_amount), 0),
+    ).filter(Order.status != "cancelled", Order.user_id.isnot(None))\
+        .group_by(Order.user_id)\
+        .all()
+
+    if rows:
+        user_ids, first_orders, last_orders, total_orders, frequency, monetary, lifetime_value = zip(*rows)
+        last_ordered = np.asarray(last_orders, dtype="datetime64[s]")
+        recency_days = ((np.datetime64(now, "s") - last_ordered) // np.timedelta64(1, "D")).clip(min=0)
+        frequency = np.asarray(frequency, dtype=np.int64)
+        monetary = np.asarray(monetary, dtype=np.float64)
+
+        r = quantile_scores(recency_days, higher_is_better=False)
+        f = quantile_scores(frequency)
+        m = quantile_scores(monetary)
+        segments = segment_labels(r, f, m, np.asarray(total_orders, dtype=np.int64))
+
+        records = [
+            {
+                "user_id": user_ids[i],
+                "recency_days": int(recency_days[i]),
+                "frequency": int(frequency[i]),
+                "monetary": float(monetary[i]),
+                "lifetime_value": lifetime_value[i],
+                "r_score": int(r[i]),
+                "f_score": int(f[i]),
+                "m_score": int(m[i]),
+                "segment": str(segments[i]),
+                "first_order_at": first_orders[i],
+                "last_order_at": last_orders[i],
+                "computed_at": now,
+            }
+            for i in range(len(user_ids))
+        ]
+        for start in range(0, len(records), SEGMENT_UPSERT_CHUNK):
+            statement = insert(CustomerSegment).values(records[start:start + SEGMENT_UPSERT_CHUNK])
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[CustomerSegment.user_id],
+                set_={key: statement.excluded[key] for key in records[0] if key != "user_id"},
+            ))
+            db.commit()
+
+    # Customers whose orders have all been cancelled or deleted since the last run
+    db.execute(delete(CustomerSegment).where(CustomerSegment.computed_at < now))
+    db.commit()
+    return len(rows)
+
+
+def segment_summary(db: Session) -> Dict[str, dict]:
+    rows = db.query(
+        CustomerSegment.segment,
+        func.count(),
+        func.sum(CustomerSegment.lifetime_value),
+        func.max(CustomerSegment.computed_at),
+    ).group_by(CustomerSegment.segment).all()
+    return {
+        segment: {"customers": customers, "lifetime_value": float(value or 0), "computed_at": computed_at}
+        for segment, customers, value, computed_at in rows
+    }
@@ -1,10 +1,59 @@
-from fastapi import Header, HTTPException, status
+import hmac
+import math
+from typing import Optional
+
+from fastapi import Header, HTTPException, Request, status
+
+from app import ratelimit
 
 API_KEY = "123123123"  # ← Same as in main.py, or load from env
 
+def is_valid_api_key(api_key: Optional[str]) -> bool:
+    return api_key is not None and hmac.compare_digest(api_key.encode(), API_KEY.encode())
+
+
 def verify_api_key(x_api_key: str = Header(...)):
-    if x_api_key != API_KEY:
+    if not is_valid_api_key(x_api_key):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or missing API Key",
         )
+
+
+def rate_limit(group: str):
+    limit = ratelimit.RATE_LIMITS[group]
+
+    async def check_rate_limit(request: Request):
+        client_ip = request.client.host if request.client else None
+        api_key = request.headers.get("x-api-key")
+        key = group + ":" + ratelimit.client_key(api_key if is_valid_api_key(api_key) else None, client_ip)
+        allowed, retry_after = ratelimit.store.take(key, limit)
+        if not allowed:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+    return check_rate_limit
+
+
+# Set by /batch on the scopes of its sub-requests, which run inside the batch's own slot
+BATCH_SUB_REQUEST = "batch.sub_request"
+
+
+async def shed_load(request: Request):
+    if request.scope.get(BATCH_SUB_REQUEST):
+        yield
+        return
+    store = ratelimit.store
+    if not store.acquire_slot(ratelimit.MAX_IN_FLIGHT):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Server is busy, try again shortly",
+            headers={"Retry-After": str(ratelimit.SHED_RETRY_AFTER_SECONDS)},
+        )
+    try:
+        yield
+    finally:
+        store.release_slot()
@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+import zlib
+from datetime import date, datetime
+from decimal import Decimal
+from itertools import chain
+from typing import Callable, Iterable, Iterator, List, Optional, Sequence
+
+from fastapi.responses import StreamingResponse
+
+from app.database import SessionLocal
+
+EXPORT_BATCH_SIZE = 5000
+# Rows are buffered into chunks of roughly this many bytes before being sent
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_FORMATS = ("csv", "ndjson")
+
+
+def stream_rows(statement) -> Iterator[tuple]:
+    """Rows of ``statement`` from a server-side cursor, ``EXPORT_BATCH_SIZE`` at a time.
+
+    The export outlives the request's own session, so it runs on a session of its own.
+    """
+    db = SessionLocal()
+    try:
+        result = db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for row in result:
+            yield tuple(row)
+    finally:
+        db.close()
+
+
+def _json_default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _chunked(lines: Iterable[str]) -> Iterator[bytes]:
+    buffer, size = [], 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode()
+
+
+def csv_lines(columns: Sequence[str], rows: Iterable[tuple]) -> Iterator[str]:
+    line = io.StringIO()
+    writer = csv.writer(line)
+    for values in chain([columns], rows):
+        writer.writerow(values)
+        yield line.getvalue()
+        line.seek(0)
+        line.truncate()
+
+
+def ndjson_lines(records: Iterable[dict]) -> Iterator[str]:
+    for record in records:
+        yield json.dumps(record, default=_json_default) + "\n"
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_response(
+    name: str,
+    statement,
+    columns: List[str],
+    file_format: str,
+    compress: bool,
+    to_records: Optional[Callable[[Iterable[tuple]], Iterable[dict]]] = None,
+) -> StreamingResponse:
+    """Stream ``statement`` as CSV (one line per row) or NDJSON.
+
+    ``to_records`` lets NDJSON exports reshape rows, e.g. to nest joined child rows.
+    """
+    rows = stream_rows(statement)
+    if file_format == "csv":
+        lines = csv_lines(columns, rows)
+        media_type, extension = "text/csv", "csv"
+    else:
+        records = to_records(rows) if to_records else (dict(zip(columns, row)) for row in rows)
+        lines = ndjson_lines(records)
+        media_type, extension = "application/x-ndjson", "ndjson"
+    body = _chunked(lines)
+    if compress:
+        body = gzip_chunks(body)
+        media_type, extension = "application/gzip", extension + ".gz"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}.{extension}"'},
+    )
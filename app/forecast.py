@@ -0,0 +1,105 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import Date, and_, cast, func, select
+from sqlalchemy.orm import Session
+
+from app.models.product import Candle
+from app.models.user import Order, OrderItem
+
+
+def daily_sales_matrix(db: Session, candle_ids: np.ndarray, start: date, window_days: int) -> np.ndarray:
+    """Units sold per candle (rows, in ``candle_ids`` order) per day (columns) since ``start``."""
+    day = cast(OrderItem.order_date, Date)
+    daily = select(
+        OrderItem.candle_id,
+        (day - start).label("day_index"),
+        func.sum(OrderItem.quantity).label("quantity"),
+    ).join(Order, and_(Order.id == OrderItem.order_id, Order.order_date == OrderItem.order_date))\
+        .where(
+            OrderItem.order_date >= datetime.combine(start, datetime.min.time()),
+            OrderItem.order_date < datetime.combine(start + timedelta(days=window_days), datetime.min.time()),
+            OrderItem.candle_id.isnot(None),
+            Order.status != "cancelled",
+        )\
+        .group_by(OrderItem.candle_id, day)\
+        .subquery()
+    # One row of three arrays, so the columns go straight into NumPy without a loop over sales
+    sold_ids, day_index, quantities = db.execute(select(
+        func.array_agg(daily.c.candle_id), func.array_agg(daily.c.day_index), func.array_agg(daily.c.quantity),
+    )).one()
+    return sales_matrix(
+        candle_ids,
+        np.asarray(sold_ids or [], dtype=np.int64),
+        np.asarray(day_index or [], dtype=np.int64),
+        np.asarray(quantities or [], dtype=np.float64),
+        window_days,
+    )
+
+
+def sales_matrix(candle_ids: np.ndarray, sold_ids: np.ndarray, day_index: np.ndarray,
+                 quantities: np.ndarray, window_days: int) -> np.ndarray:
+    """Scatter (candle, day, quantity) sales into a candles x days matrix; ``candle_ids`` is sorted."""
+    if not len(sold_ids) or not len(candle_ids):
+        return np.zeros((len(candle_ids), window_days))
+    # candle_ids is sorted, so each sale finds its row with a binary search
+    row_index = np.searchsorted(candle_ids, sold_ids).clip(max=len(candle_ids) - 1)
+    known = (candle_ids[row_index] == sold_ids) & (day_index >= 0) & (day_index < window_days)
+    cell = row_index[known] * window_days + day_index[known]
+    sales = np.bincount(cell, weights=quantities[known], minlength=len(candle_ids) * window_days)
+    return sales.reshape(len(candle_ids), window_days)
+
+
+def stock_risk(stock: np.ndarray, sales: np.ndarray, horizon_days: int, lead_time_days: int,
+               service_level_z: float) -> tuple:
+    """(demand, days_of_cover, reorder_point, at_risk) with at_risk the row indexes soonest out first."""
+    demand = sales.mean(axis=1)
+    volatility = sales.std(axis=1)
+    days_of_cover = np.divide(stock, demand, out=np.full_like(stock, np.inf), where=demand > 0)
+    safety_stock = service_level_z * volatility * np.sqrt(lead_time_days)
+    reorder_point = np.ceil(demand * lead_time_days + safety_stock)
+
+    at_risk = np.flatnonzero((days_of_cover <= horizon_days) | ((stock <= reorder_point) & (demand > 0)))
+    at_risk = at_risk[np.argsort(days_of_cover[at_risk], kind="stable")]
+    return demand, days_of_cover, reorder_point, at_risk
+
+
+def stock_forecast(
+    db: Session,
+    horizon_days: int,
+    window_days: int = 28,
+    lead_time_days: int = 7,
+    service_level_z: float = 1.65,
+    limit: int = 500,
+) -> dict:
+    """Moving-average demand, days of cover and reorder points for every candle at once."""
+    candles = db.query(Candle.id, Candle.name, Candle.stock_quantity).order_by(Candle.id).all()
+    if not candles:
+        return {"candles": 0, "at_risk_total": 0, "at_risk": []}
+    ids, names, stock = zip(*candles)
+    ids = np.asarray(ids, dtype=np.int64)
+    stock = np.asarray(stock, dtype=np.float64)
+
+    # Today (in UTC, like order dates) is still filling up, so the window is the last
+    # `window_days` complete days
+    start = datetime.utcnow().date() - timedelta(days=window_days)
+    sales = daily_sales_matrix(db, ids, start, window_days)
+    demand, days_of_cover, reorder_point, at_risk = stock_risk(
+        stock, sales, horizon_days, lead_time_days, service_level_z
+    )
+    return {
+        "candles": len(ids),
+        "at_risk_total": len(at_risk),
+        "at_risk": [
+            {
+                "id": int(ids[i]),
+                "name": names[i],
+                "stock_quantity": int(stock[i]),
+                "avg_daily_demand": round(float(demand[i]), 3),
+                "days_of_cover": round(float(days_of_cover[i]), 1),
+                "reorder_point": int(reorder_point[i]),
+                "stockout_within_horizon": bool(days_of_cover[i] <= horizon_days),
+            }
+            for i in at_risk[:limit]
+        ],
+    }
@@ -0,0 +1,231 @@
+import logging
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.job import Job
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = 2
+JOB_BATCH_SIZE = 500
+POLL_INTERVAL_SECONDS = 0.5
+SCHEDULER_INTERVAL_SECONDS = 30
+RETRY_BASE_SECONDS = 5
+RETRY_MAX_SECONDS = 3600
+# Claimed jobs are marked running until this long after the claim; if the worker dies
+# first they become claimable again. Longer than the slowest handler (maintenance jobs).
+JOB_LEASE = timedelta(minutes=30)
+CLAIMABLE_STATUSES = ("pending", "running")
+
+# type -> handler(db, payloads); all payloads of a batch share one transaction
+handlers: Dict[str, Callable[[Session, List[dict]], None]] = {}
+# type -> interval for maintenance jobs enqueued by the scheduler thread
+schedules: Dict[str, timedelta] = {}
+
+_stop = threading.Event()
+_threads: List[threading.Thread] = []
+
+
+def job_handler(job_type: str):
+    def register(fn):
+        handlers[job_type] = fn
+        return fn
+    return register
+
+
+def schedule(job_type: str, every: timedelta) -> None:
+    schedules[job_type] = every
+
+
+def enqueue(db: Session, job_type: str, payload: Optional[dict] = None, delay: Optional[timedelta] = None) -> Job:
+    """Add a job in the caller's transaction; it becomes visible to workers on commit."""
+    job = Job(type=job_type, payload=payload or {}, run_at=datetime.utcnow() + (delay or timedelta()))
+    db.add(job)
+    return job
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(RETRY_BASE_SECONDS * 2 ** (attempts - 1), RETRY_MAX_SECONDS))
+
+
+def _claim_batch(db: Session) -> List[Job]:
+    """Lease a batch of ready jobs of one type and commit, so no row locks are held while they run."""
+    now = datetime.utcnow()
+    # Pending jobs, and running ones whose lease ran out because their worker died
+    ready = db.query(Job).filter(Job.status.in_(CLAIMABLE_STATUSES), Job.run_at <= now)
+    first = ready.order_by(Job.run_at).with_for_update(skip_locked=True).first()
+    if first is None:
+        db.rollback()
+        return []
+    rest = ready.filter(Job.type == first.type, Job.id != first.id)\
+        .order_by(Job.run_at)\
+        .limit(JOB_BATCH_SIZE - 1)\
+        .with_for_update(skip_locked=True)\
+        .all()
+    batch = []
+    for job in [first] + rest:
+        if job.attempts >= job.max_attempts:
+            # Only an expired lease gets here: the job's last attempt never finished
+            job.status = "failed"
+            job.last_error = "Lease expired"
+            continue
+        job.status = "running"
+        job.attempts += 1
+        job.run_at = now + JOB_LEASE
+        batch.append(job)
+    db.commit()
+    return batch
+
+
+def run_once() -> int:
+    """Claim and run one batch of same-type jobs; returns the number of jobs processed."""
+    # Not expired on commit, so the claimed jobs stay usable without reloading them
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        batch = _claim_batch(db)
+        if not batch:
+            return 0
+        job_type = batch[0].type
+        handler = handlers.get(job_type)
+        if handler is None:
+            logger.error("No handler registered for job type %r", job_type)
+            error = f"LookupError('No handler registered for job type {job_type!r}')"
+            failed = {job.id: error for job in batch}
+        else:
+            failed = _run_batch(db, handler, batch)
+        done = [job.id for job in batch if job.id not in failed]
+        if done:
+            db.query(Job).filter(Job.id.in_(done)).delete(synchronize_session=False)
+        _record_failure(batch, failed)
+        db.commit()
+        return len(batch)
+    finally:
+        db.close()
+
+
+def _run_batch(db: Session, handler: Callable, batch: List[Job]) -> Dict[int, str]:
+    """Run ``handler`` over the batch; returns {job id: error} for the jobs that failed.
+
+    If the batch as a whole fails, its jobs are run again one by one so a single bad payload
+    does not hold back (or use up the attempts of) the rest. Each run is wrapped in a SAVEPOINT.
+    """
+    try:
+        with db.begin_nested():
+            handler(db, [job.payload for job in batch])
+        return {}
+    except Exception as exc:
+        if len(batch) == 1:
+            logger.exception("Job %s (%s) failed", batch[0].id, batch[0].type)
+            return {batch[0].id: repr(exc)}
+        logger.warning("Job batch %s failed (%d jobs), retrying one by one: %r", batch[0].type, len(batch), exc)
+
+    failed = {}
+    for job in batch:
+        try:
+            with db.begin_nested():
+                handler(db, [job.payload])
+        except Exception as exc:
+            logger.exception("Job %s (%s) failed", job.id, job.type)
+            failed[job.id] = repr(exc)
+    return failed
+
+
+def _record_failure(batch: List[Job], failed: Dict[int, str]) -> None:
+    now = datetime.utcnow()
+    for job in batch:
+        if job.id not in failed:
+            continue
+        job.last_error = failed[job.id]
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+        else:
+            job.status = "pending"
+            job.run_at = now + retry_delay(job.attempts)
+
+
+def _worker_loop() -> None:
+    while not _stop.is_set():
+        try:
+            processed = run_once()
+        except Exception:
+            logger.exception("Job worker error")
+            processed = 0
+        if not processed:
+            _stop.wait(POLL_INTERVAL_SECONDS)
+
+
+def _enqueue_due(job_types: List[str]) -> None:
+    db = SessionLocal()
+    try:
+        waiting = {
+            job_type for (job_type,) in db.query(Job.type)
+            .filter(Job.type.in_(job_types), Job.status.in_(CLAIMABLE_STATUSES))
+            .distinct()
+        }
+        for job_type in job_types:
+            if job_type not in waiting:
+                enqueue(db, job_type)
+        db.commit()
+    finally:
+        db.close()
+
+
+def _scheduler_loop() -> None:
+    next_run: Dict[str, datetime] = {}
+    while not _stop.is_set():
+        now = datetime.utcnow()
+        due = [job_type for job_type in schedules if next_run.get(job_type, now) <= now]
+        if due:
+            try:
+                _enqueue_due(due)
+            except Exception:
+                logger.exception("Job scheduler error")
+            else:
+                for job_type in due:
+                    next_run[job_type] = now + schedules[job_type]
+        _stop.wait(SCHEDULER_INTERVAL_SECONDS)
+
+
+def start_workers(concurrency: int = JOB_WORKERS) -> None:
+    if _threads:
+        return
+    _stop.clear()
+    for n in range(concurrency):
+        thread = threading.Thread(target=_worker_loop, name=f"job-worker-{n}", daemon=True)
+        thread.start()
+        _threads.append(thread)
+    scheduler = threading.Thread(target=_scheduler_loop, name="job-scheduler", daemon=True)
+    scheduler.start()
+    _threads.append(scheduler)
+
+
+def stop_workers(timeout: float = 10) -> None:
+    _stop.set()
+    for thread in _threads:
+        thread.join(timeout)
+    _threads.clear()
+
+
+def queue_stats(db: Session) -> List[dict]:
+    now = datetime.utcnow()
+    rows = db.query(
+        Job.type,
+        Job.status,
+        func.count(Job.id).label("count"),
+        func.min(Job.run_at).label("oldest_run_at"),
+    ).group_by(Job.type, Job.status).all()
+    return [
+        {
+            "type": row.type,
+            "status": row.status,
+            "count": row.count,
+            "lag_seconds": max((now - row.oldest_run_at).total_seconds(), 0)
+            if row.status == "pending" else None,
+        }
+        for row in rows
+    ]
@@ -1,13 +1,41 @@
-from fastapi import FastAPI
-from app.routes import user_routes, admin_routes, candle_routes  # Make sure candle_routes is imported
+from contextlib import asynccontextmanager
 
-app = FastAPI()
+from fastapi import Depends, FastAPI
+from app import jobs, media, tasks  # tasks registers the background job handlers
+from app.dependencies import rate_limit, shed_load
+from app.routes import user_routes, admin_routes, batch_routes, candle_routes  # Make sure candle_routes is imported
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    jobs.start_workers()
+    yield
+    jobs.stop_workers()
+    media.shutdown_pool()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Include v1 routes
-app.include_router(candle_routes.router, prefix="/candles", tags=["v1"])
-app.include_router(user_routes.router, prefix="/user/candles", tags=["user-v2"])
-app.include_router(admin_routes.router, prefix="/admin/candles", tags=["admin-v2"])
+app.include_router(
+    candle_routes.router, prefix="/candles", tags=["v1"],
+    dependencies=[Depends(rate_limit("public")), Depends(shed_load)],
+)
+app.include_router(
+    user_routes.router, prefix="/user/candles", tags=["user-v2"],
+    dependencies=[Depends(rate_limit("user")), Depends(shed_load)],
+)
+app.include_router(
+    admin_routes.router, prefix="/admin/candles", tags=["admin-v2"],
+    dependencies=[Depends(rate_limit("admin")), Depends(shed_load)],
+)
+# Sub-requests pass through their own routers' limits as well
+app.include_router(
+    batch_routes.router, tags=["batch"],
+    dependencies=[Depends(rate_limit("user")), Depends(shed_load)],
+)
+app.mount(media.MEDIA_URL, media.ImmutableStaticFiles(directory=media.MEDIA_ROOT, check_dir=False), name="media")
 @app.get("/")
 async def root():
     return {"message": "Candle API up and running"}
-# uvicorn app.main:app --reload
\ No newline at end of file
+# uvicorn app.main:app --reload
@@ -0,0 +1,149 @@
+"""Uploaded candle images.
+
+Originals are stored once per content hash under ``MEDIA_ROOT``; resized JPEG and WebP
+variants are rendered by a ``media.variants`` background job, in a process pool, and recorded
+on every ``CandleImage`` row with that hash. Paths never change for a given hash, so
+everything under ``MEDIA_URL`` is served as immutable.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from PIL import Image, ImageOps
+from fastapi.staticfiles import StaticFiles
+from sqlalchemy import exists
+from sqlalchemy.orm import Session
+
+from app import jobs
+from app.models.job import Job
+from app.models.product import CandleImage
+
+MEDIA_ROOT = Path(os.getenv("MEDIA_ROOT", "media"))
+MEDIA_URL = "/media"
+MAX_UPLOAD_BYTES = 10 * 1024 * 1024
+IMAGE_FORMATS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+VARIANT_WIDTHS = (320, 640, 1280)
+# variant name -> (Pillow format, file extension, save options)
+VARIANT_FORMATS = {
+    "webp": ("WEBP", "webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 82, "progressive": True, "optimize": True}),
+}
+MEDIA_WORKERS = 2
+VARIANTS_JOB = "media.variants"
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def image_format(data: bytes) -> Optional[str]:
+    """File extension for a supported image, or None. Only the header is read."""
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            return IMAGE_FORMATS.get(image.format)
+    except (OSError, Image.DecompressionBombError):
+        return None
+
+
+def _relative_dir(content_hash: str) -> Path:
+    return Path(content_hash[:2]) / content_hash[2:4]
+
+
+def media_url(relative: Path) -> str:
+    return f"{MEDIA_URL}/{relative.as_posix()}"
+
+
+def _write_atomic(path: Path, write) -> None:
+    # Written next to the target and renamed, so readers never see a partial file
+    partial = path.with_name(f"{path.name}.{uuid.uuid4().hex}.part")
+    write(partial)
+    os.replace(partial, path)
+
+
+def store_original(data: bytes, extension: str) -> tuple:
+    """Write ``data`` under its sha256 unless it is already there; returns (hash, relative path)."""
+    content_hash = hashlib.sha256(data).hexdigest()
+    relative = _relative_dir(content_hash) / f"{content_hash}.{extension}"
+    path = MEDIA_ROOT / relative
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _write_atomic(path, lambda partial: partial.write_bytes(data))
+    return content_hash, relative
+
+
+def render_variants(media_root: str, content_hash: str, original: str) -> Dict[str, Dict[str, str]]:
+    """Runs in a worker process: {width: {format: url}} for every variant of ``original``."""
+    root = Path(media_root)
+    variants = {}
+    with Image.open(root / original) as image:
+        image = ImageOps.exif_transpose(image)
+        for width in VARIANT_WIDTHS:
+            # No upscaling; the smallest variant is always made so there is a thumbnail
+            if width > image.width and variants:
+                break
+            resized = None
+            variants[str(width)] = {}
+            for name, (pil_format, extension, options) in VARIANT_FORMATS.items():
+                relative = _relative_dir(content_hash) / f"{content_hash}-{width}.{extension}"
+                path = root / relative
+                if not path.exists():
+                    if resized is None:
+                        resized = image.copy()
+                        resized.thumbnail((width, width * 4), Image.LANCZOS)
+                    frame = resized.convert("RGB") if pil_format == "JPEG" else resized
+                    _write_atomic(path, lambda partial: frame.save(partial, pil_format, **options))
+                variants[str(width)][name] = media_url(relative)
+    return variants
+
+
+def save_variants(db: Session, payloads: List[dict]) -> None:
+    """``media.variants`` job handler: render each payload's variants and record them.
+
+    A failed render fails the job, which the queue retries, so ``variants`` does not stay
+    NULL after a crash or restart.
+    """
+    pool = _get_pool()
+    futures = [
+        (payload["content_hash"], pool.submit(render_variants, str(MEDIA_ROOT), payload["content_hash"], payload["original"]))
+        for payload in payloads
+    ]
+    for content_hash, future in futures:
+        variants = future.result()
+        db.query(CandleImage).filter(CandleImage.content_hash == content_hash)\
+            .update({CandleImage.variants: variants}, synchronize_session=False)
+
+
+def schedule_variants(db: Session, content_hash: str, original: Path) -> None:
+    """Queue rendering in the caller's transaction, unless it is already queued for this hash."""
+    queued = db.query(exists().where(
+        Job.type == VARIANTS_JOB, Job.status == "pending", Job.payload["content_hash"].astext == content_hash
+    )).scalar()
+    if not queued:
+        jobs.enqueue(db, VARIANTS_JOB, {"content_hash": content_hash, "original": original.as_posix()})
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Forking would copy the job and suggest threads' held locks and the pooled DB
+        # connections into the workers; spawned workers start from a clean interpreter
+        _pool = ProcessPoolExecutor(max_workers=MEDIA_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+
+class ImmutableStaticFiles(StaticFiles):
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = CACHE_CONTROL
+        return response
@@ -0,0 +1,16 @@
+from sqlalchemy import Column, BigInteger, Integer, String, Text, TIMESTAMP
+from sqlalchemy.dialects.postgresql import JSONB
+from app.database import Base
+from datetime import datetime
+
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(BigInteger, primary_key=True)
+    type = Column(String(100), nullable=False)
+    payload = Column(JSONB, nullable=False, default=dict)
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
+    last_error = Column(Text)
+    created_at = Column(TIMESTAMP, default=datetime.utcnow)
@@ -1,4 +1,5 @@
 from sqlalchemy import Column, Integer, String, Text, DECIMAL, ForeignKey, Table, TIMESTAMP
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime
@@ -19,9 +20,14 @@ class Category(Base):
 
     candles = relationship("Candle", back_populates="category")
 
+# Largest values the candles columns can hold: price is DECIMAL(10,2), the counts are INT
+MAX_PRICE = 99_999_999.99
+MAX_INT = 2_147_483_647
+
 class Candle(Base):
     __tablename__ = "candles"
     id = Column(Integer, primary_key=True, index=True)
+    sku = Column(String(64), unique=True)
     name = Column(String(150), nullable=False)
     description = Column(Text)
     price = Column(DECIMAL(10, 2), nullable=False)
@@ -36,8 +42,9 @@ class Candle(Base):
     updated_at = Column(TIMESTAMP, default=datetime.utcnow)
 
     category = relationship("Category", back_populates="candles")
-    images = relationship("CandleImage", back_populates="candle", cascade="all, delete")
-    tags = relationship("Tag", secondary=candle_tags, back_populates="candles")
+    # Dependent rows are removed by ON DELETE CASCADE in Postgres, not loaded and deleted one by one
+    images = relationship("CandleImage", back_populates="candle", cascade="all, delete", passive_deletes=True)
+    tags = relationship("Tag", secondary=candle_tags, back_populates="candles", passive_deletes=True)
 
 class CandleImage(Base):
     __tablename__ = "candle_images"
@@ -45,6 +52,9 @@ class CandleImage(Base):
     candle_id = Column(Integer, ForeignKey("candles.id", ondelete="CASCADE"))
     image_url = Column(Text, nullable=False)
     alt_text = Column(String(150))
+    # Set for uploaded images; variants maps width -> format -> URL once they are rendered
+    content_hash = Column(String(64), index=True)
+    variants = Column(JSONB)
 
     candle = relationship("Candle", back_populates="images")
 
@@ -53,4 +63,4 @@ class Tag(Base):
     id = Column(Integer, primary_key=True)
     name = Column(String(50), unique=True, nullable=False)
 
-    candles = relationship("Candle", secondary=candle_tags, back_populates="tags")
+    candles = relationship("Candle", secondary=candle_tags, back_populates="tags", passive_deletes=True)
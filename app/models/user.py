@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, TIMESTAMP, Boolean, DECIMAL
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, ForeignKeyConstraint, TIMESTAMP, Boolean, DECIMAL
 from sqlalchemy.orm import relationship
 from app.database import Base
 from datetime import datetime
@@ -13,13 +13,13 @@ class User(Base):
     profile_picture = Column(Text)
     created_at = Column(TIMESTAMP, default=datetime.utcnow)
 
-    addresses = relationship("Address", back_populates="user", cascade="all, delete-orphan")
-    orders = relationship("Order", back_populates="user", cascade="all, delete-orphan")
-    wishlist = relationship("Wishlist", back_populates="user", cascade="all, delete-orphan")
-    notifications = relationship("Notification", back_populates="user", cascade="all, delete-orphan")
-    reviews = relationship("Review", back_populates="user", cascade="all, delete-orphan")
-    payment_methods = relationship("PaymentMethod", back_populates="user", cascade="all, delete-orphan")
-    tokens = relationship("UserToken", back_populates="user", cascade="all, delete-orphan")
+    addresses = relationship("Address", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    orders = relationship("Order", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    wishlist = relationship("Wishlist", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    notifications = relationship("Notification", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    reviews = relationship("Review", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    payment_methods = relationship("PaymentMethod", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+    tokens = relationship("UserToken", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
 
 class Address(Base):
     __tablename__ = "addresses"
@@ -37,22 +37,36 @@ class Address(Base):
 class Order(Base):
     __tablename__ = "orders"
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     status = Column(String(50), default="pending")
-    order_date = Column(TIMESTAMP, default=datetime.utcnow)
+    # Partition key of orders and order_items (monthly ranges)
+    order_date = Column(TIMESTAMP, nullable=False, default=datetime.utcnow)
     total_amount = Column(DECIMAL(10,2))
 
     user = relationship("User", back_populates="orders")
-    items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
+    items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan", passive_deletes=True)
+
+class OrderStatusTransition(Base):
+    # Allowed order status changes, checked in SQL by order status updates
+    __tablename__ = "order_status_transitions"
+    from_status = Column(String(50), primary_key=True)
+    to_status = Column(String(50), primary_key=True)
 
 class OrderItem(Base):
     __tablename__ = "order_items"
     id = Column(Integer, primary_key=True)
-    order_id = Column(Integer, ForeignKey("orders.id", ondelete="CASCADE"))
+    order_id = Column(Integer, nullable=False)
+    order_date = Column(TIMESTAMP, nullable=False)
     candle_id = Column(Integer)
     quantity = Column(Integer, nullable=False)
     price_at_order = Column(DECIMAL(10,2), nullable=False)
 
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["order_id", "order_date"], ["orders.id", "orders.order_date"], ondelete="CASCADE"
+        ),
+    )
+
     order = relationship("Order", back_populates="items")
 
 class Wishlist(Base):
@@ -76,7 +90,7 @@ class Notification(Base):
 class Review(Base):
     __tablename__ = "reviews"
     id = Column(Integer, primary_key=True)
-    user_id = Column(Integer, ForeignKey("users.id"))
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
     candle_id = Column(Integer)
     rating = Column(Integer)
     comment = Column(Text)
@@ -107,3 +121,19 @@ class UserToken(Base):
     expires_at = Column(TIMESTAMP)
 
     user = relationship("User", back_populates="tokens") 
+
+class CustomerSegment(Base):
+    """RFM scores per customer, rewritten in bulk by the ``analytics.rfm`` job."""
+    __tablename__ = "customer_segments"
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    recency_days = Column(Integer, nullable=False)
+    frequency = Column(Integer, nullable=False)
+    monetary = Column(DECIMAL(12,2), nullable=False)
+    lifetime_value = Column(DECIMAL(12,2), nullable=False, index=True)
+    r_score = Column(Integer, nullable=False)
+    f_score = Column(Integer, nullable=False)
+    m_score = Column(Integer, nullable=False)
+    segment = Column(String(30), nullable=False, index=True)
+    first_order_at = Column(TIMESTAMP)
+    last_order_at = Column(TIMESTAMP)
+    computed_at = Column(TIMESTAMP, nullable=False)
@@ -0,0 +1,20 @@
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import desc, tuple_
+
+
+def keyset_page(query, date_column, id_column, before_date: Optional[datetime], before_id: Optional[int]):
+    """Newest-first page of ``query`` starting strictly after the cursor ``(before_date, before_id)``.
+
+    Pass the ``(date, id)`` of the last row of the previous page as the cursor. Unlike OFFSET,
+    deep pages cost the same as the first one, and the plain ``date_column <= before_date``
+    bound lets Postgres prune partitions newer than the cursor.
+    """
+    if before_date is not None:
+        query = query.filter(date_column <= before_date)
+        if before_id is not None:
+            query = query.filter(tuple_(date_column, id_column) < tuple_(before_date, before_id))
+        else:
+            query = query.filter(date_column < before_date)
+    return query.order_by(desc(date_column), desc(id_column))
@@ -0,0 +1,108 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class RateLimit:
+    __slots__ = ("rate", "burst")
+
+    def __init__(self, rate: float, burst: int):
+        # rate: tokens refilled per second, burst: bucket capacity
+        self.rate = rate
+        self.burst = burst
+
+
+# Per route group limits, keyed the same way the routers are mounted in main.py
+RATE_LIMITS: Dict[str, RateLimit] = {
+    "public": RateLimit(rate=20, burst=40),
+    "user": RateLimit(rate=20, burst=40),
+    "admin": RateLimit(rate=50, burst=100),
+}
+
+# Maximum number of requests doing DB work at once before we start shedding load
+MAX_IN_FLIGHT = 64
+SHED_RETRY_AFTER_SECONDS = 1
+
+
+class RateLimitStore(ABC):
+    """State backend for the limiter and the load shedder.
+
+    The in-memory store below is per process; a shared store (Redis, memcached, ...)
+    can subclass this to enforce the same limits across nodes.
+    """
+
+    @abstractmethod
+    def take(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        """Consume one token from the bucket at ``key``; returns (allowed, retry_after)."""
+
+    @abstractmethod
+    def acquire_slot(self, max_in_flight: int) -> bool:
+        """Take a slot unless ``max_in_flight`` requests already hold one."""
+
+    @abstractmethod
+    def release_slot(self) -> None:
+        """Give back a slot taken with ``acquire_slot``."""
+
+    @abstractmethod
+    def in_flight(self) -> int:
+        """Slots currently held, reported by /v2/load/stats."""
+
+
+class InMemoryStore(RateLimitStore):
+    # The least recently used bucket is dropped once the table grows past this size
+    MAX_BUCKETS = 100_000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._in_flight = 0
+
+    def take(self, key: str, limit: RateLimit) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.MAX_BUCKETS:
+                    self._buckets.popitem(last=False)
+                bucket = self._buckets[key] = [float(limit.burst), now]
+            else:
+                self._buckets.move_to_end(key)
+            tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return True, 0.0
+            bucket[0] = tokens
+            return False, (1 - tokens) / limit.rate
+
+    def acquire_slot(self, max_in_flight: int) -> bool:
+        with self._lock:
+            if self._in_flight >= max_in_flight:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release_slot(self) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def in_flight(self) -> int:
+        return self._in_flight
+
+
+store: RateLimitStore = InMemoryStore()
+
+
+def set_store(new_store: RateLimitStore) -> None:
+    global store
+    store = new_store
+
+
+def client_key(verified_api_key: Optional[str], client_ip: Optional[str]) -> str:
+    # Only a key that has been checked may pick the bucket; otherwise a client could send a
+    # fresh random key with every request and always get a full bucket
+    if verified_api_key:
+        return f"key:{verified_api_key}|{client_ip or '-'}"
+    return f"ip:{client_ip or '-'}"
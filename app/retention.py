@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import delete, select, text
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.user import Notification, UserToken
+
+PURGE_BATCH_SIZE = 5000
+PURGE_INTERVAL = timedelta(hours=1)
+# How many months of partitions to keep created ahead of time
+PARTITION_MONTHS_AHEAD = 3
+# Tables that are, or may be, range partitioned by month (see sql/tables.sql and
+# sql/partitioning.sql); create_monthly_partitions() is a no-op for the ones that are not
+PARTITIONED_TABLES = ["orders", "order_items", "notifications", "user_tokens"]
+
+
+class RetentionPolicy:
+    def __init__(self, model, keep: timedelta, extra: Callable[[datetime], list] = lambda now: []):
+        self.model = model
+        self.keep = keep
+        # Additional conditions that make a row purgeable before it ages out
+        self.extra = extra
+
+    def cutoff(self, now: datetime) -> datetime:
+        return now - self.keep
+
+
+RETENTION_POLICIES: Dict[str, RetentionPolicy] = {
+    "notifications": RetentionPolicy(Notification, keep=timedelta(days=180)),
+    "user_tokens": RetentionPolicy(
+        UserToken,
+        keep=timedelta(days=30),
+        extra=lambda now: [
+            UserToken.is_used.is_(True) & (UserToken.created_at < now - timedelta(days=1)),
+            UserToken.expires_at < now - timedelta(days=1),
+        ],
+    ),
+}
+
+
+def retention_cutoff(table: str) -> datetime:
+    """Oldest ``created_at`` still kept for ``table``; lets hot queries prune old partitions."""
+    return RETENTION_POLICIES[table].cutoff(datetime.utcnow())
+
+
+def is_partitioned(db: Session, table: str) -> bool:
+    return db.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:t))"),
+        {"t": table},
+    ).scalar()
+
+
+def create_partitions(db: Session, tables: List[str]) -> Dict[str, int]:
+    created = {}
+    for table in tables:
+        created[table] = db.execute(
+            text("SELECT create_monthly_partitions(:t, CURRENT_DATE, :ahead)"),
+            {"t": table, "ahead": PARTITION_MONTHS_AHEAD},
+        ).scalar()
+    db.commit()
+    return created
+
+
+def purge_table(db: Session, table: str, now: datetime, batch_size: int = PURGE_BATCH_SIZE) -> dict:
+    policy = RETENTION_POLICIES[table]
+    model = policy.model
+    cutoff = policy.cutoff(now)
+    dropped = 0
+    if is_partitioned(db, table):
+        # Whole months past the cutoff go away instantly; the rest is deleted row by row
+        dropped = db.execute(
+            text("SELECT drop_partitions_before(:t, :cutoff)"), {"t": table, "cutoff": cutoff}
+        ).scalar()
+        db.commit()
+
+    # One condition at a time, so every batch is an index range scan on that condition's
+    # index rather than a rescan of the whole table for an OR of all of them
+    deleted = 0
+    for condition in [model.created_at < cutoff, *policy.extra(now)]:
+        while True:
+            batch = select(model.id).where(condition).limit(batch_size).with_for_update(skip_locked=True)
+            result = db.execute(
+                delete(model).where(model.id.in_(batch.scalar_subquery()))
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            deleted += result.rowcount
+            if result.rowcount < batch_size:
+                break
+    return {"table": table, "partitions_dropped": dropped, "rows_deleted": deleted}
+
+
+def purge_expired(tables: Optional[List[str]] = None) -> List[dict]:
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        return [purge_table(db, table, now) for table in tables or RETENTION_POLICIES]
+    finally:
+        db.close()
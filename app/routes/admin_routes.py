@@ -1,23 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import io
+import tempfile
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, func
-from app.database import SessionLocal
-from app.models.product import Candle, Category, CandleImage, Tag
-from app.models.user import User, Order, OrderItem, Review, Address, PaymentMethod, Notification, UserToken
-from pydantic import BaseModel
+from sqlalchemy import and_, or_, desc, func, select, delete, update, exists, any_, bindparam, cast, column, values, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.exc import SQLAlchemyError
+from app.database import get_db
+from app.models.product import MAX_INT, MAX_PRICE, Candle, Category, CandleImage, Tag
+from app.models.user import User, CustomerSegment, Order, OrderItem, OrderStatusTransition, Review, Address, PaymentMethod, Notification, UserToken
+from pydantic import BaseModel, Field, ValidationError, validator
 from app.dependencies import verify_api_key
-from typing import List, Optional
+from app import catalog_import, coalesce, customer_analytics, export, forecast, jobs, media, ratelimit, retention, suggest
+from app.candle_expand import candle_detail, expand_options, parse_expand
+from app.pagination import keyset_page
+from typing import Any, Dict, List, Optional
 from datetime import datetime, timedelta
 
 router = APIRouter()
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+dashboard_flight = coalesce.single_flight("admin.dashboard")
 
 
 class CandleCreate(BaseModel):
@@ -33,8 +35,38 @@ class CandleCreate(BaseModel):
     category_id: Optional[int] = None
 
 
+class CandleUpdate(BaseModel):
+    # Partial update: only the fields present in the body are changed
+    name: Optional[str] = Field(None, max_length=150)
+    description: Optional[str] = None
+    price: Optional[float] = Field(None, ge=0, le=MAX_PRICE)
+    stock_quantity: Optional[int] = Field(None, ge=0, le=MAX_INT)
+    weight_grams: Optional[int] = Field(None, ge=0, le=MAX_INT)
+    burn_time_hours: Optional[int] = Field(None, ge=0, le=MAX_INT)
+    color: Optional[str] = Field(None, max_length=50)
+    scent: Optional[str] = Field(None, max_length=100)
+    material: Optional[str] = Field(None, max_length=100)
+    category_id: Optional[int] = None
+
+    @validator("name", "price", "stock_quantity")
+    def not_null(cls, value):
+        if value is None:
+            raise ValueError("may not be null")
+        return value
+
+
+class CandleBatchUpdate(CandleUpdate):
+    id: int
+
+
+class CandleBatchUpdateRequest(BaseModel):
+    # Items are validated one by one so a bad item does not reject the whole batch
+    changes: List[Dict[str, Any]] = Field(min_length=1, max_length=50000)
+
+
 class CandleRead(CandleCreate):
     id: int
+    sku: Optional[str] = None
     created_at: datetime
     updated_at: datetime
 
@@ -73,11 +105,20 @@ class CandleImageCreate(BaseModel):
 
 class CandleImageRead(CandleImageCreate):
     id: int
+    content_hash: Optional[str] = None
+    variants: Optional[Dict[str, Dict[str, str]]] = None
 
     class Config:
         orm_mode = True
 
 
+class CandleDetail(CandleRead):
+    # Only filled in when requested with ?expand=images,tags,category
+    images: Optional[List[CandleImageRead]] = None
+    tags: Optional[List[TagRead]] = None
+    category: Optional[CategoryRead] = None
+
+
 class UserRead(BaseModel):
     id: int
     email: str
@@ -90,6 +131,27 @@ class UserRead(BaseModel):
         orm_mode = True
 
 
+class CustomerSegmentRead(BaseModel):
+    segment: str
+    recency_days: int
+    frequency: int
+    monetary: float
+    lifetime_value: float
+    r_score: int
+    f_score: int
+    m_score: int
+    last_order_at: Optional[datetime] = None
+    computed_at: datetime
+
+    class Config:
+        orm_mode = True
+
+
+class UserListItem(UserRead):
+    # None until the customer has a non-cancelled order and analytics.rfm has run since
+    segment: Optional[CustomerSegmentRead] = None
+
+
 class OrderRead(BaseModel):
     id: int
     user_id: int
@@ -176,6 +238,20 @@ class UserTokenRead(BaseModel):
         orm_mode = True
 
 
+class BulkIds(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=10000)
+
+
+class OrderStatusBulkUpdate(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=50000)
+    status: str
+
+
+class FulfilmentQueue(BaseModel):
+    counts: Dict[str, int]
+    oldest_open: List[OrderRead]
+
+
 class DashboardStats(BaseModel):
     total_users: int
     total_orders: int
@@ -192,28 +268,53 @@ def create_candle(candle: CandleCreate, db: Session = Depends(get_db)):
     db.add(db_candle)
     db.commit()
     db.refresh(db_candle)
+    suggest.index.update_candle(db_candle)
     return db_candle
 
 
-@router.get("/v2/", response_model=List[CandleRead], dependencies=[Depends(verify_api_key)])
+@router.post("/v2/import", dependencies=[Depends(verify_api_key)])
+async def import_candles(
+    request: Request,
+    file_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+    db: Session = Depends(get_db)
+):
+    # The raw body is the file; it is spooled to disk as it arrives so memory stays flat
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as spool:
+        async for chunk in request.stream():
+            # Past max_size the spool writes to disk, which must not block the event loop
+            await run_in_threadpool(spool.write, chunk)
+        spool.seek(0)
+        stream = io.TextIOWrapper(spool, encoding="utf-8-sig", errors=catalog_import.TEXT_ERRORS, newline="")
+        records = catalog_import.read_records(stream, file_format)
+        report = await run_in_threadpool(catalog_import.import_catalog, db, records)
+    if report["upserted"]:
+        suggest.index.mark_stale()
+    return report
+
+
+@router.get("/v2/", response_model=List[CandleDetail], dependencies=[Depends(verify_api_key)])
 def list_candles(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     category_id: Optional[int] = None,
+    expand: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    query = db.query(Candle)
+    fields = parse_expand(expand)
+    query = db.query(Candle).options(*expand_options(fields))
     if category_id:
         query = query.filter(Candle.category_id == category_id)
-    return query.offset(skip).limit(limit).all()
+    candles = query.order_by(Candle.id).offset(skip).limit(limit).all()
+    return [candle_detail(candle, fields, CandleDetail) for candle in candles]
 
 
-@router.get("/v2/{candle_id}", response_model=CandleRead, dependencies=[Depends(verify_api_key)])
-def get_candle(candle_id: int, db: Session = Depends(get_db)):
-    candle = db.query(Candle).filter(Candle.id == candle_id).first()
+@router.get("/v2/{candle_id}", response_model=CandleDetail, dependencies=[Depends(verify_api_key)])
+def get_candle(candle_id: int, expand: Optional[str] = None, db: Session = Depends(get_db)):
+    fields = parse_expand(expand)
+    candle = db.query(Candle).options(*expand_options(fields)).filter(Candle.id == candle_id).first()
     if not candle:
         raise HTTPException(status_code=404, detail="Candle not found")
-    return candle
+    return candle_detail(candle, fields, CandleDetail)
 
 
 @router.put("/v2/{candle_id}", response_model=CandleRead, dependencies=[Depends(verify_api_key)])
@@ -226,25 +327,151 @@ def update_candle(candle_id: int, candle: CandleCreate, db: Session = Depends(ge
         setattr(db_candle, key, value)
     db.commit()
     db.refresh(db_candle)
+    suggest.index.update_candle(db_candle)
     return db_candle
 
 
+@router.patch("/v2/{candle_id}", response_model=CandleRead, dependencies=[Depends(verify_api_key)])
+def patch_candle(candle_id: int, candle: CandleUpdate, db: Session = Depends(get_db)):
+    changes = candle.dict(exclude_unset=True)
+    if changes:
+        statement = update(Candle).where(Candle.id == candle_id).values(**changes)\
+            .returning(Candle).execution_options(synchronize_session=False)
+    else:
+        statement = select(Candle).where(Candle.id == candle_id)
+    db_candle = db.execute(statement).scalars().first()
+    if not db_candle:
+        raise HTTPException(status_code=404, detail="Candle not found")
+    result = CandleRead.from_orm(db_candle)
+    db.commit()
+    if {"name", "scent"} & changes.keys():
+        suggest.index.update_candle(result)
+    return result
+
+
+BATCH_UPDATE_CHUNK_SIZE = 1000
+
+
+@router.patch("/v2/", dependencies=[Depends(verify_api_key)])
+def batch_update_candles(body: CandleBatchUpdateRequest, db: Session = Depends(get_db)):
+    invalid, parsed = [], []
+    for index, raw in enumerate(body.changes):
+        try:
+            item = CandleBatchUpdate.parse_obj(raw)
+        except ValidationError as exc:
+            invalid.append({
+                "index": index,
+                "id": raw.get("id"),
+                "errors": [
+                    {"field": ".".join(str(loc) for loc in error["loc"]), "message": error["msg"]}
+                    for error in exc.errors()
+                ],
+            })
+            continue
+        parsed.append((index, item.dict(exclude_unset=True)))
+
+    # Unknown categories are caught here, in one query, rather than as FK violations
+    category_ids = [changes["category_id"] for _, changes in parsed if changes.get("category_id") is not None]
+    known_categories = set(
+        db.execute(select(Category.id).where(Category.id == _ids_param(category_ids))).scalars()
+    ) if category_ids else set()
+
+    # field set -> {id: changes}; items changing the same fields share a statement
+    groups: Dict[tuple, Dict[int, dict]] = {}
+    for index, changes in parsed:
+        candle_id = changes.pop("id")
+        if changes.get("category_id") is not None and changes["category_id"] not in known_categories:
+            invalid.append({
+                "index": index,
+                "id": candle_id,
+                "errors": [{"field": "category_id", "message": "category not found"}],
+            })
+        elif changes:
+            groups.setdefault(tuple(sorted(changes)), {})[candle_id] = changes
+
+    requested, updated, failed = set(), set(), set()
+    for fields, items in groups.items():
+        requested.update(items)
+        rows = [(candle_id, *(changes[field] for field in fields)) for candle_id, changes in items.items()]
+        for start in range(0, len(rows), BATCH_UPDATE_CHUNK_SIZE):
+            chunk = rows[start:start + BATCH_UPDATE_CHUNK_SIZE]
+            # A chunk the database rejects is rolled back on its own and reported as failed
+            try:
+                with db.begin_nested():
+                    updated.update(_update_candles_from_values(db, fields, chunk))
+            except SQLAlchemyError:
+                failed.update(row[0] for row in chunk)
+    db.commit()
+    if any({"name", "scent"} & set(fields) for fields in groups):
+        suggest.index.mark_stale()
+    return {
+        "updated": len(updated),
+        "not_found": sorted(requested - updated - failed),
+        "failed": sorted(failed - updated),
+        "invalid": invalid,
+    }
+
+
+def _update_candles_from_values(db: Session, fields: tuple, rows: List[tuple]) -> List[int]:
+    # UPDATE candles SET ... FROM (VALUES (...), ...) AS v(id, ...) WHERE candles.id = v.id
+    # Row triggers (trg_set_updated_at) still fire for every updated candle.
+    table = Candle.__table__
+    data = values(
+        column("id", Integer), *(column(field, table.c[field].type) for field in fields), name="v"
+    ).data(rows)
+    statement = update(Candle).where(Candle.id == data.c.id).values({
+        # VALUES columns that are all NULL come out untyped, so cast back to the column type
+        field: cast(data.c[field], table.c[field].type) for field in fields
+    }).returning(Candle.id).execution_options(synchronize_session=False)
+    return db.execute(statement).scalars().all()
+
+
 @router.delete("/v2/deleteid/{candle_id}", status_code=204, dependencies=[Depends(verify_api_key)])
 def delete_candle(candle_id: int, db: Session = Depends(get_db)):
-    candle = db.query(Candle).filter(Candle.id == candle_id).first()
-    if not candle:
+    result = _delete_candles(db, [candle_id])
+    if result["in_use"]:
+        raise HTTPException(status_code=409, detail="Candle has orders and cannot be deleted")
+    if result["not_found"]:
         raise HTTPException(status_code=404, detail="Candle not found")
-    db.delete(candle)
-    db.commit()
     return
 
 
+@router.post("/v2/bulk-delete", dependencies=[Depends(verify_api_key)])
+def bulk_delete_candles(body: BulkIds, db: Session = Depends(get_db)):
+    return _delete_candles(db, body.ids)
+
+
+def _ids_param(ids: List[int]):
+    return any_(bindparam("ids", list(set(ids)), type_=ARRAY(Integer)))
+
+
+def _delete_candles(db: Session, ids: List[int]) -> dict:
+    # Images, tags, wishlist entries and reviews go with the candle through ON DELETE CASCADE.
+    # Candles that were ordered are kept so order history stays intact.
+    ordered = exists().where(OrderItem.candle_id == Candle.id)
+    deleted = db.execute(
+        delete(Candle).where(Candle.id == _ids_param(ids), ~ordered).returning(Candle.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    for candle_id in deleted:
+        suggest.index.remove_candle(candle_id)
+    remaining = set(ids) - set(deleted)
+    in_use = db.execute(select(Candle.id).where(Candle.id.in_(remaining))).scalars().all() if remaining else []
+    return {
+        "deleted": len(deleted),
+        "in_use": sorted(in_use),
+        "not_found": sorted(remaining - set(in_use)),
+    }
+
+
 @router.post("/v2/categories/", response_model=CategoryRead, dependencies=[Depends(verify_api_key)])
 def create_category(category: CategoryCreate, db: Session = Depends(get_db)):
     db_category = Category(**category.dict())
     db.add(db_category)
     db.commit()
     db.refresh(db_category)
+    suggest.index.set_term(("category", db_category.id), db_category.name)
     return db_category
 
 
@@ -262,6 +489,7 @@ def update_category(category_id: int, category: CategoryCreate, db: Session = De
         setattr(db_category, key, value)
     db.commit()
     db.refresh(db_category)
+    suggest.index.set_term(("category", db_category.id), db_category.name)
     return db_category
 
 
@@ -272,6 +500,7 @@ def delete_category(category_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Category not found")
     db.delete(db_category)
     db.commit()
+    suggest.index.remove_term(("category", category_id))
     return
 
 
@@ -281,6 +510,7 @@ def create_tag(tag: TagCreate, db: Session = Depends(get_db)):
     db.add(db_tag)
     db.commit()
     db.refresh(db_tag)
+    suggest.index.set_term(("tag", db_tag.id), db_tag.name)
     return db_tag
 
 
@@ -296,6 +526,7 @@ def delete_tag(tag_id: int, db: Session = Depends(get_db)):
         raise HTTPException(status_code=404, detail="Tag not found")
     db.delete(db_tag)
     db.commit()
+    suggest.index.remove_term(("tag", tag_id))
     return
 
 
@@ -312,6 +543,52 @@ def create_candle_image(image: CandleImageCreate, db: Session = Depends(get_db))
     return db_image
 
 
+@router.post("/v2/images/upload", response_model=CandleImageRead, dependencies=[Depends(verify_api_key)])
+async def upload_candle_image(
+    request: Request,
+    candle_id: int,
+    alt_text: Optional[str] = Query(None, max_length=150),
+    db: Session = Depends(get_db)
+):
+    # The raw body is the image file
+    data = bytearray()
+    async for chunk in request.stream():
+        data.extend(chunk)
+        if len(data) > media.MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Image is too large")
+    return await run_in_threadpool(_save_uploaded_image, db, candle_id, bytes(data), alt_text)
+
+
+def _save_uploaded_image(db: Session, candle_id: int, data: bytes, alt_text: Optional[str]) -> CandleImage:
+    extension = media.image_format(data)
+    if not extension:
+        raise HTTPException(status_code=415, detail="Unsupported image format")
+    if not db.query(exists().where(Candle.id == candle_id)).scalar():
+        raise HTTPException(status_code=404, detail="Candle not found")
+
+    content_hash, relative = media.store_original(data, extension)
+    image_url = media.media_url(relative)
+    db_image = db.query(CandleImage).filter(CandleImage.candle_id == candle_id, CandleImage.image_url == image_url).first()
+    if db_image:
+        if db_image.variants is None:
+            # Rendering may have failed for good; uploading again retries it
+            media.schedule_variants(db, content_hash, relative)
+            db.commit()
+        return db_image
+    # The same file uploaded for another candle reuses the variants already rendered for it
+    variants = db.query(CandleImage.variants)\
+        .filter(CandleImage.content_hash == content_hash, CandleImage.variants.isnot(None)).limit(1).scalar()
+    db_image = CandleImage(
+        candle_id=candle_id, image_url=image_url, alt_text=alt_text, content_hash=content_hash, variants=variants
+    )
+    db.add(db_image)
+    if variants is None:
+        media.schedule_variants(db, content_hash, relative)
+    db.commit()
+    db.refresh(db_image)
+    return db_image
+
+
 @router.get("/v2/images/candle/{candle_id}", response_model=List[CandleImageRead], dependencies=[Depends(verify_api_key)])
 def get_candle_images(candle_id: int, db: Session = Depends(get_db)):
     return db.query(CandleImage).filter(CandleImage.candle_id == candle_id).all()
@@ -327,13 +604,41 @@ def delete_candle_image(image_id: int, db: Session = Depends(get_db)):
     return
 
 
-@router.get("/v2/users/", response_model=List[UserRead], dependencies=[Depends(verify_api_key)])
+# Each RFM sort matches an index on customer_segments, user_id included as the tie breaker
+USER_SORTS = {
+    "id": [User.id],
+    "lifetime_value": [desc(CustomerSegment.lifetime_value), CustomerSegment.user_id],
+    "monetary": [desc(CustomerSegment.monetary), CustomerSegment.user_id],
+    "frequency": [desc(CustomerSegment.frequency), CustomerSegment.user_id],
+    "recency": [CustomerSegment.recency_days, CustomerSegment.user_id],
+}
+
+
+@router.get("/v2/users/", response_model=List[UserListItem], dependencies=[Depends(verify_api_key)])
 def list_users(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
+    segment: Optional[str] = Query(None, pattern="^(" + "|".join(customer_analytics.SEGMENTS) + ")$"),
+    sort: str = Query("id", pattern="^(" + "|".join(USER_SORTS) + ")$"),
     db: Session = Depends(get_db)
 ):
-    return db.query(User).offset(skip).limit(limit).all()
+    query = db.query(User, CustomerSegment)
+    # Filtering or sorting on RFM fields lists only customers that have been segmented,
+    # which lets Postgres walk the customer_segments indexes
+    if segment or sort != "id":
+        query = query.join(CustomerSegment, CustomerSegment.user_id == User.id)
+    else:
+        query = query.outerjoin(CustomerSegment, CustomerSegment.user_id == User.id)
+    if segment:
+        query = query.filter(CustomerSegment.segment == segment)
+    rows = query.order_by(*USER_SORTS[sort]).offset(skip).limit(limit).all()
+    return [
+        UserListItem(
+            **UserRead.from_orm(user).dict(),
+            segment=CustomerSegmentRead.from_orm(user_segment) if user_segment else None,
+        )
+        for user, user_segment in rows
+    ]
 
 
 @router.get("/v2/users/{user_id}", response_model=UserRead, dependencies=[Depends(verify_api_key)])
@@ -346,25 +651,98 @@ def get_user(user_id: int, db: Session = Depends(get_db)):
 
 @router.delete("/v2/users/{user_id}", status_code=204, dependencies=[Depends(verify_api_key)])
 def delete_user(user_id: int, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    db.delete(user)
+    # Postgres cascades to addresses, orders, reviews, tokens, ... in the same statement
+    deleted = db.execute(
+        delete(User).where(User.id == user_id).execution_options(synchronize_session=False)
+    ).rowcount
     db.commit()
+    if not deleted:
+        raise HTTPException(status_code=404, detail="User not found")
     return
 
 
+@router.post("/v2/users/bulk-delete", dependencies=[Depends(verify_api_key)])
+def bulk_delete_users(body: BulkIds, db: Session = Depends(get_db)):
+    deleted = db.execute(
+        delete(User).where(User.id == _ids_param(body.ids)).returning(User.id)
+        .execution_options(synchronize_session=False)
+    ).scalars().all()
+    db.commit()
+    return {"deleted": len(deleted), "not_found": sorted(set(body.ids) - set(deleted))}
+
+
 @router.get("/v2/orders/", response_model=List[OrderRead], dependencies=[Depends(verify_api_key)])
 def list_orders(
     skip: int = Query(0, ge=0),
     limit: int = Query(100, ge=1, le=1000),
     status: Optional[str] = None,
+    before_date: Optional[datetime] = None,
+    before_id: Optional[int] = None,
     db: Session = Depends(get_db)
 ):
+    # Pass order_date/id of the last order of a page as before_date/before_id for the next one
     query = db.query(Order)
     if status:
         query = query.filter(Order.status == status)
-    return query.order_by(desc(Order.order_date)).offset(skip).limit(limit).all()
+    query = keyset_page(query, Order.order_date, Order.id, before_date, before_id)
+    return query.offset(skip).limit(limit).all()
+
+
+# Valid statuses and the changes between them live in order_status_transitions
+OPEN_ORDER_STATUSES = ["pending", "processing"]
+
+
+def _check_status(db: Session, status: str) -> None:
+    known = or_(OrderStatusTransition.from_status == status, OrderStatusTransition.to_status == status)
+    if not db.query(exists().where(known)).scalar():
+        raise HTTPException(status_code=400, detail="Invalid status")
+
+
+def _transition_orders(db: Session, condition, status: str) -> List[tuple]:
+    # Only orders whose current status may move to the new one are touched
+    return db.execute(
+        update(Order)
+        .where(
+            condition,
+            OrderStatusTransition.from_status == Order.status,
+            OrderStatusTransition.to_status == status,
+        )
+        .values(status=status)
+        .returning(Order.id)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+
+@router.get("/v2/orders/fulfilment-queue", response_model=FulfilmentQueue, dependencies=[Depends(verify_api_key)])
+def get_fulfilment_queue(limit: int = Query(50, ge=1, le=1000), db: Session = Depends(get_db)):
+    counts = db.query(Order.status, func.count(Order.id)).group_by(Order.status).all()
+    oldest_open = db.query(Order)\
+        .filter(Order.status.in_(OPEN_ORDER_STATUSES))\
+        .order_by(Order.order_date, Order.id)\
+        .limit(limit).all()
+    return FulfilmentQueue(
+        counts={status: count for status, count in counts},
+        oldest_open=[OrderRead.from_orm(order) for order in oldest_open]
+    )
+
+
+@router.post("/v2/orders/status/bulk", dependencies=[Depends(verify_api_key)])
+def bulk_update_order_status(body: OrderStatusBulkUpdate, db: Session = Depends(get_db)):
+    _check_status(db, body.status)
+    updated = _transition_orders(db, Order.id == _ids_param(body.ids), body.status)
+    db.commit()
+
+    skipped = set(body.ids) - {order_id for (order_id,) in updated}
+    current = dict(
+        db.query(Order.id, Order.status).filter(Order.id.in_(skipped)).all()
+    ) if skipped else {}
+    return {
+        "updated": len(updated),
+        "invalid_transition": [
+            {"id": order_id, "status": current[order_id]} for order_id in sorted(current)
+        ],
+        "not_found": sorted(skipped - current.keys()),
+    }
 
 
 @router.get("/v2/orders/{order_id}", response_model=OrderRead, dependencies=[Depends(verify_api_key)])
@@ -377,22 +755,25 @@ def get_order(order_id: int, db: Session = Depends(get_db)):
 
 @router.put("/v2/orders/{order_id}/status", dependencies=[Depends(verify_api_key)])
 def update_order_status(order_id: int, status: str, db: Session = Depends(get_db)):
-    order = db.query(Order).filter(Order.id == order_id).first()
-    if not order:
-        raise HTTPException(status_code=404, detail="Order not found")
-    
-    valid_statuses = ["pending", "processing", "shipped", "delivered", "cancelled"]
-    if status not in valid_statuses:
-        raise HTTPException(status_code=400, detail="Invalid status")
-    
-    db.query(Order).filter(Order.id == order_id).update({"status": status})
+    updated = _transition_orders(db, Order.id == order_id, status)
+    if not updated:
+        current = db.query(Order.status).filter(Order.id == order_id).scalar()
+        if current is None:
+            raise HTTPException(status_code=404, detail="Order not found")
+        _check_status(db, status)
+        raise HTTPException(status_code=409, detail=f"An order cannot move from {current} to {status}")
     db.commit()
     return {"message": "Order status updated successfully"}
 
 
 @router.get("/v2/orders/{order_id}/items", response_model=List[OrderItemRead], dependencies=[Depends(verify_api_key)])
 def get_order_items(order_id: int, db: Session = Depends(get_db)):
-    return db.query(OrderItem).filter(OrderItem.order_id == order_id).all()
+    # Resolving the order date first lets the planner scan a single order_items partition
+    order_date = db.query(Order.order_date).filter(Order.id == order_id).scalar_subquery()
+    return db.query(OrderItem).filter(
+        OrderItem.order_id == order_id,
+        OrderItem.order_date == order_date
+    ).all()
 
 
 @router.get("/v2/reviews/", response_model=List[ReviewRead], dependencies=[Depends(verify_api_key)])
@@ -439,7 +820,8 @@ def list_notifications(
     is_read: Optional[bool] = None,
     db: Session = Depends(get_db)
 ):
-    query = db.query(Notification)
+    # Older rows are purged anyway; the bound lets partitioned tables skip old months
+    query = db.query(Notification).filter(Notification.created_at >= retention.retention_cutoff("notifications"))
     if user_id:
         query = query.filter(Notification.user_id == user_id)
     if is_read is not None:
@@ -458,14 +840,13 @@ def create_notification(
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    notification = Notification(
-        user_id=user_id,
-        title=title,
-        message=message
-    )
-    db.add(notification)
+    jobs.enqueue(db, "notifications.create", {
+        "user_id": user_id,
+        "title": title,
+        "message": message
+    })
     db.commit()
-    return {"message": "Notification created successfully"}
+    return {"message": "Notification queued successfully"}
 
 
 @router.get("/v2/user-tokens/", response_model=List[UserTokenRead], dependencies=[Depends(verify_api_key)])
@@ -476,7 +857,7 @@ def list_user_tokens(
     token_type: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    query = db.query(UserToken)
+    query = db.query(UserToken).filter(UserToken.created_at >= retention.retention_cutoff("user_tokens"))
     if user_id:
         query = query.filter(UserToken.user_id == user_id)
     if token_type:
@@ -484,8 +865,24 @@ def list_user_tokens(
     return query.order_by(desc(UserToken.created_at)).offset(skip).limit(limit).all()
 
 
+@router.post("/v2/retention/purge", dependencies=[Depends(verify_api_key)])
+def purge_expired_rows(db: Session = Depends(get_db)):
+    jobs.enqueue(db, "retention.purge")
+    db.commit()
+    return {"message": "Retention purge queued"}
+
+
+@router.get("/v2/jobs/stats", dependencies=[Depends(verify_api_key)])
+def get_job_queue_stats(db: Session = Depends(get_db)):
+    return {"queues": jobs.queue_stats(db)}
+
+
 @router.get("/v2/dashboard/stats", response_model=DashboardStats, dependencies=[Depends(verify_api_key)])
 def get_dashboard_stats(db: Session = Depends(get_db)):
+    return dashboard_flight.response("stats", lambda: _load_dashboard_stats(db))
+
+
+def _load_dashboard_stats(db: Session) -> DashboardStats:
     total_users = db.query(func.count(User.id)).scalar()
     total_orders = db.query(func.count(Order.id)).scalar()
     total_candles = db.query(func.count(Candle.id)).scalar()
@@ -521,6 +918,109 @@ def get_dashboard_stats(db: Session = Depends(get_db)):
     )
 
 
+ORDER_EXPORT_COLUMNS = ["id", "user_id", "status", "order_date", "total_amount"]
+ORDER_ITEM_EXPORT_COLUMNS = ["item_id", "candle_id", "quantity", "price_at_order"]
+
+
+def _export_params(file_format: str = Query("csv", alias="format", pattern="^(csv|ndjson)$"),
+                   gzip: bool = False,
+                   start_date: Optional[datetime] = None,
+                   end_date: Optional[datetime] = None):
+    return {"file_format": file_format, "compress": gzip, "start_date": start_date, "end_date": end_date}
+
+
+def _date_bounds(column, params):
+    bounds = []
+    if params["start_date"]:
+        bounds.append(column >= params["start_date"])
+    if params["end_date"]:
+        bounds.append(column < params["end_date"])
+    return bounds
+
+
+def _date_range(statement, column, params):
+    return statement.where(*_date_bounds(column, params))
+
+
+def _orders_with_items(rows):
+    # Rows arrive ordered by order, so each order's items are consecutive
+    current = None
+    width = len(ORDER_EXPORT_COLUMNS)
+    for row in rows:
+        if current is None or current["id"] != row[0]:
+            if current is not None:
+                yield current
+            current = dict(zip(ORDER_EXPORT_COLUMNS, row[:width]), items=[])
+        if row[width] is not None:
+            current["items"].append(dict(zip(ORDER_ITEM_EXPORT_COLUMNS, row[width:])))
+    if current is not None:
+        yield current
+
+
+@router.get("/v2/export/orders", dependencies=[Depends(verify_api_key)])
+def export_orders(include_items: bool = False, params: dict = Depends(_export_params)):
+    columns = list(ORDER_EXPORT_COLUMNS)
+    statement = select(Order.id, Order.user_id, Order.status, Order.order_date, Order.total_amount)
+    to_records = None
+    if include_items:
+        columns += ORDER_ITEM_EXPORT_COLUMNS
+        statement = statement.add_columns(
+            OrderItem.id, OrderItem.candle_id, OrderItem.quantity, OrderItem.price_at_order
+        ).outerjoin(OrderItem, and_(
+            OrderItem.order_id == Order.id,
+            OrderItem.order_date == Order.order_date,
+            # Bounding the items as well keeps the join to the same partitions; in the ON clause
+            # so orders without items are still exported
+            *_date_bounds(OrderItem.order_date, params),
+        ))
+        to_records = _orders_with_items
+    statement = _date_range(statement, Order.order_date, params)
+    statement = statement.order_by(Order.order_date, Order.id)
+    return export.export_response(
+        "orders", statement, columns, params["file_format"], params["compress"], to_records
+    )
+
+
+@router.get("/v2/export/users", dependencies=[Depends(verify_api_key)])
+def export_users(params: dict = Depends(_export_params)):
+    columns = ["id", "email", "full_name", "phone", "created_at"]
+    statement = select(User.id, User.email, User.full_name, User.phone, User.created_at)
+    statement = _date_range(statement, User.created_at, params).order_by(User.id)
+    return export.export_response("users", statement, columns, params["file_format"], params["compress"])
+
+
+@router.get("/v2/export/reviews", dependencies=[Depends(verify_api_key)])
+def export_reviews(params: dict = Depends(_export_params)):
+    columns = ["id", "user_id", "candle_id", "rating", "comment", "created_at"]
+    statement = select(
+        Review.id, Review.user_id, Review.candle_id, Review.rating, Review.comment, Review.created_at
+    )
+    statement = _date_range(statement, Review.created_at, params).order_by(Review.id)
+    return export.export_response("reviews", statement, columns, params["file_format"], params["compress"])
+
+
+@router.get("/v2/export/candles", dependencies=[Depends(verify_api_key)])
+def export_candles(params: dict = Depends(_export_params)):
+    columns = [
+        "id", "sku", "name", "description", "price", "stock_quantity", "weight_grams",
+        "burn_time_hours", "color", "scent", "material", "category_id", "created_at", "updated_at",
+    ]
+    statement = select(*(getattr(Candle, column) for column in columns))
+    statement = _date_range(statement, Candle.created_at, params).order_by(Candle.id)
+    return export.export_response("candles", statement, columns, params["file_format"], params["compress"])
+
+
+@router.get("/v2/coalescing/stats", dependencies=[Depends(verify_api_key)])
+def get_coalescing_stats():
+    return {"groups": coalesce.all_stats()}
+
+
+@router.get("/v2/load/stats", dependencies=[Depends(verify_api_key)])
+def get_load_stats():
+    # This request holds one of the slots itself
+    return {"in_flight": ratelimit.store.in_flight(), "max_in_flight": ratelimit.MAX_IN_FLIGHT}
+
+
 @router.get("/v2/analytics/sales", dependencies=[Depends(verify_api_key)])
 def get_sales_analytics(
     days: int = Query(30, ge=1, le=365),
@@ -577,3 +1077,28 @@ def get_inventory_analytics(db: Session = Depends(get_db)):
         ]
     }
 
+
+@router.get("/v2/analytics/inventory/forecast", dependencies=[Depends(verify_api_key)])
+def get_stock_forecast(
+    horizon_days: int = Query(14, ge=1, le=365),
+    window_days: int = Query(28, ge=7, le=365),
+    lead_time_days: int = Query(7, ge=0, le=180),
+    service_level_z: float = Query(1.65, ge=0, le=5),
+    limit: int = Query(500, ge=1, le=10000),
+    db: Session = Depends(get_db)
+):
+    # Candles that run out within horizon_days, or are already below their reorder point
+    return forecast.stock_forecast(db, horizon_days, window_days, lead_time_days, service_level_z, limit)
+
+
+@router.get("/v2/analytics/customers/segments", dependencies=[Depends(verify_api_key)])
+def get_customer_segments(db: Session = Depends(get_db)):
+    # Customers and lifetime value per RFM segment, as of the last analytics.rfm run
+    return customer_analytics.segment_summary(db)
+
+
+@router.post("/v2/analytics/customers/segments/refresh", status_code=202, dependencies=[Depends(verify_api_key)])
+def refresh_customer_segments(db: Session = Depends(get_db)):
+    job = jobs.enqueue(db, "analytics.rfm")
+    db.commit()
+    return {"job_id": job.id}
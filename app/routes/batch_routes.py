@@ -0,0 +1,179 @@
+import asyncio
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Request
+from pydantic import BaseModel, Field, validator
+
+from app.database import SessionLocal, batch_session
+from app.dependencies import BATCH_SUB_REQUEST
+
+router = APIRouter()
+
+MAX_BATCH_REQUESTS = 25
+# GETs of one batch running at once, each holding a pooled connection; kept below the
+# engine's pool_size (5) so a batch never has to wait for overflow connections
+BATCH_READ_CONCURRENCY = 4
+BATCH_PATH = "/batch"
+# Sub-responses are held in memory until the batch answers, so exports, images and other
+# large or binary bodies are refused instead of being collected
+MAX_SUB_RESPONSE_BYTES = 1024 * 1024
+COLLECTED_CONTENT_TYPES = ("application/json", "text/plain")
+# Headers of the batch request that sub-requests inherit unless they set their own
+INHERITED_HEADERS = {"x-api-key", "authorization", "accept-language", "user-agent", "x-forwarded-for"}
+
+
+class SubRequest(BaseModel):
+    id: Optional[str] = None
+    method: str = Field("GET", pattern="^(GET|POST|PUT|PATCH|DELETE)$")
+    path: str = Field(min_length=1, max_length=2000)
+    headers: Dict[str, str] = {}
+    body: Optional[Any] = None
+
+    @validator("path")
+    def api_path(cls, value):
+        if not value.startswith("/"):
+            raise ValueError("path must start with /")
+        if value.split("?", 1)[0].rstrip("/") == BATCH_PATH:
+            raise ValueError("batch requests cannot be nested")
+        return value
+
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest] = Field(min_length=1, max_length=MAX_BATCH_REQUESTS)
+
+
+class SubResponse(BaseModel):
+    id: Optional[str] = None
+    status: int
+    headers: Dict[str, str] = {}
+    body: Any = None
+
+
+class BatchResponse(BaseModel):
+    responses: List[SubResponse]
+
+
+def _sub_scope(request: Request, sub: SubRequest, body: bytes) -> dict:
+    path, _, query = sub.path.partition("?")
+    headers = {name: value for name, value in request.headers.items() if name in INHERITED_HEADERS}
+    headers.update((name.lower(), value) for name, value in sub.headers.items())
+    headers.pop("content-length", None)
+    if body:
+        headers.setdefault("content-type", "application/json")
+        headers["content-length"] = str(len(body))
+    return {
+        "type": "http",
+        "asgi": request.scope.get("asgi", {"version": "3.0"}),
+        "http_version": request.scope.get("http_version", "1.1"),
+        "method": sub.method,
+        "scheme": request.url.scheme,
+        "server": request.scope.get("server"),
+        "client": request.scope.get("client"),
+        "root_path": request.scope.get("root_path", ""),
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "headers": [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers.items()],
+        "state": dict(request.scope.get("state", {})),
+        BATCH_SUB_REQUEST: True,
+    }
+
+
+async def _dispatch(request: Request, sub: SubRequest) -> SubResponse:
+    """Run ``sub`` through the app in-process and collect its response."""
+    body = b"" if sub.body is None else json.dumps(sub.body).encode()
+    received = False
+
+    async def receive():
+        nonlocal received
+        if received:
+            return {"type": "http.disconnect"}
+        received = True
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status, headers, chunks = None, {}, []
+    size = 0
+    refused = None
+
+    async def send(message):
+        nonlocal status, headers, size, refused
+        if refused is not None:
+            raise RuntimeError("sub-response refused")
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            headers = {name.decode("latin-1"): value.decode("latin-1") for name, value in message.get("headers", [])}
+            if not headers.get("content-type", "application/json").startswith(COLLECTED_CONTENT_TYPES) \
+                    or "content-encoding" in headers:
+                refused = (406, "Only JSON and plain text responses can be batched; call this endpoint directly")
+        elif message["type"] == "http.response.body":
+            size += len(message.get("body", b""))
+            if size > MAX_SUB_RESPONSE_BYTES:
+                refused = (413, f"Response is larger than {MAX_SUB_RESPONSE_BYTES} bytes; call this endpoint directly")
+            else:
+                chunks.append(message.get("body", b""))
+        if refused is not None:
+            # Stops the app from producing the rest of the body
+            raise RuntimeError("sub-response refused")
+
+    try:
+        await request.app(_sub_scope(request, sub, body), receive, send)
+    except Exception:
+        # The app has already answered with a 500 unless it failed before starting a response;
+        # either way one broken sub-request must not fail the whole batch
+        if status is None:
+            status, chunks = 500, [b"Internal Server Error"]
+    if refused is not None:
+        return SubResponse(id=sub.id, status=refused[0], body={"detail": refused[1]})
+    content = b"".join(chunks)
+    headers.pop("content-length", None)
+    if headers.get("content-type", "").startswith("application/json") and content:
+        payload = json.loads(content)
+    else:
+        payload = content.decode("utf-8", errors="replace") or None
+    return SubResponse(id=sub.id, status=status, headers=headers, body=payload)
+
+
+async def _dispatch_shared(request: Request, sub: SubRequest, db) -> SubResponse:
+    token = batch_session.set(db)
+    try:
+        response = await _dispatch(request, sub)
+    finally:
+        batch_session.reset(token)
+    if response.status >= 400:
+        # Throw away anything a failed sub-request left half done in the shared session
+        db.rollback()
+    return response
+
+
+@router.post(BATCH_PATH, response_model=BatchResponse)
+async def batch(body: BatchRequest, request: Request):
+    """Run several API calls in one round trip.
+
+    Consecutive GETs run concurrently (up to BATCH_READ_CONCURRENCY at a time), each on its own
+    session. Any other method runs on its own, in order, on a session shared by the batch, so
+    later sub-requests see earlier writes. Every sub-request goes through the same authentication
+    and rate limits as a direct call; only load shedding is counted once, for the whole batch.
+    """
+    responses: List[SubResponse] = []
+    reads: List[SubRequest] = []
+    read_slots = asyncio.Semaphore(BATCH_READ_CONCURRENCY)
+
+    async def dispatch_read(sub: SubRequest) -> SubResponse:
+        async with read_slots:
+            return await _dispatch(request, sub)
+
+    # The shared session only checks out a connection once a write uses it
+    db = SessionLocal()
+    try:
+        for sub in body.requests:
+            if sub.method == "GET":
+                reads.append(sub)
+                continue
+            responses.extend(await asyncio.gather(*(dispatch_read(read) for read in reads)))
+            reads = []
+            responses.append(await _dispatch_shared(request, sub, db))
+        responses.extend(await asyncio.gather(*(dispatch_read(read) for read in reads)))
+    finally:
+        db.close()
+    return BatchResponse(responses=responses)
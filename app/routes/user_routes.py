@@ -1,21 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
-from app.models.product import Candle, Category, Tag
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.orm import Session, selectinload
+from app.database import get_db
+from app.models.product import Candle, CandleImage, Category, Tag
 from pydantic import BaseModel
-from typing import List
+from typing import Dict, List, Optional
+from datetime import datetime
 
 from app.models.user import Address, Notification, Order, User, Wishlist
+from app.candle_expand import candle_detail, expand_options, parse_expand
+from app.coalesce import single_flight
+from app.pagination import keyset_page
+from app.retention import retention_cutoff
+from app import suggest
 
 router = APIRouter()
-
-
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+candle_flight = single_flight("v2.candle")
+search_flight = single_flight("v2.search")
 
 
 class CandleRead(BaseModel):
@@ -46,6 +48,25 @@ class TagRead(BaseModel):
     class Config:
         orm_mode = True
 
+
+class CandleImageRead(BaseModel):
+    id: int
+    image_url: str
+    alt_text: str | None = None
+    # width -> {"webp": url, "jpeg": url}; filled in shortly after an upload
+    variants: Dict[str, Dict[str, str]] | None = None
+
+    class Config:
+        orm_mode = True
+
+
+class CandleDetail(CandleRead):
+    # Only filled in when requested with ?expand=images,tags,category
+    images: List[CandleImageRead] | None = None
+    tags: List[TagRead] | None = None
+    category: CategoryRead | None = None
+
+
 class UserRead(BaseModel):
     id: int
     email: str
@@ -93,12 +114,43 @@ class OrderRead(BaseModel):
         orm_mode = True
 
 
+class OrderHistoryItem(BaseModel):
+    id: int
+    candle_id: int | None = None
+    quantity: int
+    price_at_order: float
+    candle_name: str | None = None
+    candle_image_url: str | None = None
+
+
+class OrderHistoryEntry(BaseModel):
+    id: int
+    status: str
+    order_date: datetime
+    total_amount: float | None = None
+    items: List[OrderHistoryItem]
+
+
+class OrderHistoryPage(BaseModel):
+    orders: List[OrderHistoryEntry]
+    # Pass these back as before_date/before_id to get the next page; null on the last page
+    next_before_date: datetime | None = None
+    next_before_id: int | None = None
+
+
 class WishlistRead(BaseModel):
     candle_id: int
     class Config:
         orm_mode = True
 
 
+class Suggestion(BaseModel):
+    text: str
+    kind: str
+    # Candle, tag or category id; scents have none
+    id: int | None = None
+
+
 class NotificationRead(BaseModel):
     id: int
     title: str
@@ -108,17 +160,23 @@ class NotificationRead(BaseModel):
     class Config:
         orm_mode = True
 
-@router.get("/v2/", response_model=List[CandleRead])
-def get_candles(db: Session = Depends(get_db)):
-    return db.query(Candle).all()
+@router.get("/v2/", response_model=List[CandleDetail])
+def get_candles(expand: Optional[str] = None, db: Session = Depends(get_db)):
+    fields = parse_expand(expand)
+    candles = db.query(Candle).options(*expand_options(fields)).all()
+    return [candle_detail(candle, fields, CandleDetail) for candle in candles]
 
 
-@router.get("/v2/{candle_id}", response_model=CandleRead)
-def get_candle_by_id(candle_id: int, db: Session = Depends(get_db)):
-    candle = db.query(Candle).filter(Candle.id == candle_id).first()
-    if not candle:
-        raise HTTPException(status_code=404, detail="Candle not found")
-    return candle
+@router.get("/v2/{candle_id}", response_model=CandleDetail)
+def get_candle_by_id(candle_id: int, expand: Optional[str] = None, db: Session = Depends(get_db)):
+    fields = parse_expand(expand)
+
+    def load():
+        candle = db.query(Candle).options(*expand_options(fields)).filter(Candle.id == candle_id).first()
+        if not candle:
+            raise HTTPException(status_code=404, detail="Candle not found")
+        return candle_detail(candle, fields, CandleDetail)
+    return candle_flight.response((candle_id, fields), load)
 
 
 @router.get("/v2/categories/", response_model=List[CategoryRead])
@@ -128,9 +186,22 @@ def get_categories(db: Session = Depends(get_db)):
 
 @router.get("/v2/search/", response_model=List[CandleRead])
 def search_candles(query: str, db: Session = Depends(get_db)):
-    return db.query(Candle).filter(
-        (Candle.name.ilike(f"%{query}%")) | (Candle.scent.ilike(f"%{query}%"))
-    ).all()
+    def load():
+        candles = db.query(Candle).filter(
+            (Candle.name.ilike(f"%{query}%")) | (Candle.scent.ilike(f"%{query}%"))
+        ).all()
+        return [CandleRead.from_orm(candle) for candle in candles]
+    return search_flight.response(query, load)
+
+
+@router.get("/v2/suggest/", response_model=List[Suggestion])
+async def suggest_terms(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(8, ge=1, le=20)):
+    index = suggest.index
+    if not index.ready:
+        await run_in_threadpool(index.ensure_built)
+    elif index.needs_rebuild():
+        index.rebuild_in_background()
+    return index.suggest(q, limit)
 
 
 @router.get("/v2/tags/", response_model=List[TagRead])
@@ -182,6 +253,61 @@ def get_user_orders(user_id: int, db: Session = Depends(get_db)):
     return db.query(Order).filter(Order.user_id == user_id).all()
 
 
+@router.get("/v2/users/{user_id}/order-history", response_model=OrderHistoryPage)
+def get_user_order_history(
+    user_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    before_date: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    db: Session = Depends(get_db)
+):
+    # Three queries whatever the page size: orders, their items, and the candles they reference
+    query = db.query(Order).options(selectinload(Order.items)).filter(Order.user_id == user_id)
+    orders = keyset_page(query, Order.order_date, Order.id, before_date, before_id).limit(limit).all()
+
+    candle_ids = {item.candle_id for order in orders for item in order.items if item.candle_id is not None}
+    candles = {}
+    if candle_ids:
+        first_image = select(CandleImage.image_url)\
+            .where(CandleImage.candle_id == Candle.id)\
+            .order_by(CandleImage.id)\
+            .limit(1)\
+            .scalar_subquery()
+        candles = {
+            row.id: row
+            for row in db.execute(
+                select(Candle.id, Candle.name, first_image.label("image_url")).where(Candle.id.in_(candle_ids))
+            )
+        }
+
+    entries = []
+    for order in orders:
+        items = []
+        for item in order.items:
+            candle = candles.get(item.candle_id)
+            items.append(OrderHistoryItem(
+                id=item.id,
+                candle_id=item.candle_id,
+                quantity=item.quantity,
+                price_at_order=item.price_at_order,
+                candle_name=candle.name if candle else None,
+                candle_image_url=candle.image_url if candle else None,
+            ))
+        entries.append(OrderHistoryEntry(
+            id=order.id,
+            status=order.status,
+            order_date=order.order_date,
+            total_amount=order.total_amount,
+            items=items,
+        ))
+    last = orders[-1] if len(orders) == limit else None
+    return OrderHistoryPage(
+        orders=entries,
+        next_before_date=last.order_date if last else None,
+        next_before_id=last.id if last else None,
+    )
+
+
 @router.get("/v2/users/{user_id}/wishlist", response_model=List[WishlistRead])
 def get_user_wishlist(user_id: int, db: Session = Depends(get_db)):
     return db.query(Wishlist).filter(Wishlist.user_id == user_id).all()
@@ -211,7 +337,10 @@ def remove_candle_from_wishlist(user_id: int, candle_id: int, db: Session = Depe
 
 @router.get("/v2/users/{user_id}/notifications", response_model=List[NotificationRead])
 def get_user_notifications(user_id: int, db: Session = Depends(get_db)):
-    return db.query(Notification).filter(Notification.user_id == user_id).all()
+    return db.query(Notification).filter(
+        Notification.user_id == user_id,
+        Notification.created_at >= retention_cutoff("notifications"),
+    ).all()
 
 
 @router.put("/v2/users/{user_id}/notifications/{notification_id}/read", response_model=NotificationRead)
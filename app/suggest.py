@@ -0,0 +1,197 @@
+import heapq
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models.product import Candle, Category, Tag, candle_tags
+from app.models.user import OrderItem
+
+logger = logging.getLogger(__name__)
+
+# Full rebuilds pick up sales-driven popularity and changes made by other processes
+SUGGEST_MAX_AGE_SECONDS = 600
+POPULARITY_WINDOW = timedelta(days=90)
+CACHE_SIZE = 4096
+
+_WORD_SPLIT = re.compile(r"[\s\-_/,.]+")
+
+# A term is something that can be suggested: (kind, key), e.g. ("candle", 12) or ("scent", "vanilla")
+TermId = Tuple[str, object]
+
+
+def normalize(text: str) -> str:
+    return " ".join(_WORD_SPLIT.split(text.casefold())).strip()
+
+
+def _index_keys(text: str) -> List[str]:
+    # Every word start is a key, so "dre" finds "Vanilla Dream"
+    words = normalize(text).split(" ")
+    return [" ".join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class SuggestIndex:
+    """In-memory prefix index over candle names, scents, tags and categories.
+
+    Keys live in a sorted list; a prefix lookup is two bisects plus picking the most
+    popular terms in between. Results are cached per (prefix, limit) until the next change.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._keys: List[Tuple[str, TermId]] = []
+        self._terms: Dict[TermId, dict] = {}
+        self._cache: Dict[Tuple[str, int], list] = {}
+        self._built_at: Optional[float] = None
+        self._stale = False
+        self._rebuilding = False
+
+    def suggest(self, prefix: str, limit: int = 8) -> list:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        cache_key = (prefix, limit)
+        cached = self._cache.get(cache_key)
+        if cached is not None:
+            return cached
+        with self._lock:
+            lo = bisect_left(self._keys, (prefix,))
+            hi = bisect_left(self._keys, (prefix + "\uffff",), lo)
+            term_ids = {term_id for _, term_id in self._keys[lo:hi]}
+            best = heapq.nlargest(limit, term_ids, key=lambda term_id: self._terms[term_id]["popularity"])
+            result = [
+                {"text": self._terms[term_id]["text"], "kind": term_id[0],
+                 "id": term_id[1] if term_id[0] != "scent" else None}
+                for term_id in best
+            ]
+            if len(self._cache) >= CACHE_SIZE:
+                self._cache.clear()
+            self._cache[cache_key] = result
+        return result
+
+    def set_term(self, term_id: TermId, text: Optional[str], popularity: Optional[float] = None) -> None:
+        with self._lock:
+            old = self._terms.get(term_id)
+            if popularity is None:
+                popularity = old["popularity"] if old else 0
+            self._remove(term_id)
+            if text:
+                self._terms[term_id] = {"text": text, "popularity": popularity}
+                for key in _index_keys(text):
+                    insort(self._keys, (key, term_id))
+            self._cache.clear()
+
+    def remove_term(self, term_id: TermId) -> None:
+        with self._lock:
+            self._remove(term_id)
+            self._cache.clear()
+
+    def _remove(self, term_id: TermId) -> None:
+        old = self._terms.pop(term_id, None)
+        if old is None:
+            return
+        for key in _index_keys(old["text"]):
+            i = bisect_left(self._keys, (key, term_id))
+            if i < len(self._keys) and self._keys[i] == (key, term_id):
+                del self._keys[i]
+
+    def update_candle(self, candle: Candle) -> None:
+        self.set_term(("candle", candle.id), candle.name)
+        if candle.scent:
+            scent = normalize(candle.scent)
+            if ("scent", scent) not in self._terms:
+                self.set_term(("scent", scent), candle.scent)
+
+    def remove_candle(self, candle_id: int) -> None:
+        # A scent term may be shared with other candles; the next rebuild drops it if unused
+        self.remove_term(("candle", candle_id))
+
+    def mark_stale(self) -> None:
+        """Ask for a full rebuild after bulk changes; the current index keeps serving meanwhile."""
+        self._stale = True
+
+    @property
+    def ready(self) -> bool:
+        return self._built_at is not None
+
+    def needs_rebuild(self) -> bool:
+        return self._stale or self._built_at is None or time.monotonic() - self._built_at > SUGGEST_MAX_AGE_SECONDS
+
+    def rebuild(self, db: Session) -> None:
+        self._stale = False
+        terms = load_terms(db)
+        keys = sorted((key, term_id) for term_id, term in terms.items() for key in _index_keys(term["text"]))
+        with self._lock:
+            self._terms = terms
+            self._keys = keys
+            self._cache = {}
+            self._built_at = time.monotonic()
+
+    def ensure_built(self) -> None:
+        if self.ready:
+            return
+        db = SessionLocal()
+        try:
+            with self._lock:
+                if not self.ready:
+                    self.rebuild(db)
+        finally:
+            db.close()
+
+    def rebuild_in_background(self) -> None:
+        with self._lock:
+            if self._rebuilding:
+                return
+            self._rebuilding = True
+
+        def run():
+            db = SessionLocal()
+            try:
+                self.rebuild(db)
+            except Exception:
+                logger.exception("Suggest index rebuild failed")
+            finally:
+                db.close()
+                self._rebuilding = False
+
+        threading.Thread(target=run, name="suggest-rebuild", daemon=True).start()
+
+
+def load_terms(db: Session) -> Dict[TermId, dict]:
+    since = datetime.utcnow() - POPULARITY_WINDOW
+    sold = dict(
+        db.query(OrderItem.candle_id, func.sum(OrderItem.quantity))
+        .filter(OrderItem.order_date >= since, OrderItem.candle_id.isnot(None))
+        .group_by(OrderItem.candle_id)
+        .all()
+    )
+    terms: Dict[TermId, dict] = {}
+    for candle_id, name, scent in db.query(Candle.id, Candle.name, Candle.scent):
+        popularity = float(sold.get(candle_id, 0))
+        terms[("candle", candle_id)] = {"text": name, "popularity": popularity}
+        if scent:
+            term = terms.setdefault(("scent", normalize(scent)), {"text": scent, "popularity": 0.0})
+            term["popularity"] += popularity
+
+    tag_counts = dict(
+        db.query(candle_tags.c.tag_id, func.count()).group_by(candle_tags.c.tag_id).all()
+    )
+    for tag_id, name in db.query(Tag.id, Tag.name):
+        terms[("tag", tag_id)] = {"text": name, "popularity": float(tag_counts.get(tag_id, 0))}
+
+    category_counts = dict(
+        db.query(Candle.category_id, func.count(Candle.id)).group_by(Candle.category_id).all()
+    )
+    for category_id, name in db.query(Category.id, Category.name):
+        terms[("category", category_id)] = {"text": name, "popularity": float(category_counts.get(category_id, 0))}
+    return terms
+
+
+index = SuggestIndex()
@@ -0,0 +1,55 @@
+from datetime import timedelta
+from typing import List
+
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app import customer_analytics, media, retention
+from app.database import SessionLocal
+from app.jobs import job_handler, schedule
+from app.models.user import Notification
+
+
+@job_handler(media.VARIANTS_JOB)
+def render_image_variants(db: Session, payloads: List[dict]):
+    media.save_variants(db, payloads)
+
+
+@job_handler("notifications.create")
+def create_notifications(db: Session, payloads: List[dict]):
+    db.execute(
+        insert(Notification),
+        [
+            {"user_id": p["user_id"], "title": p.get("title"), "message": p.get("message")}
+            for p in payloads
+        ],
+    )
+
+
+# Maintenance jobs use their own session so they can commit in small batches
+@job_handler("retention.purge")
+def purge_expired_rows(db: Session, payloads: List[dict]):
+    retention.purge_expired()
+
+
+@job_handler("partitions.maintain")
+def create_future_partitions(db: Session, payloads: List[dict]):
+    session = SessionLocal()
+    try:
+        retention.create_partitions(session, retention.PARTITIONED_TABLES)
+    finally:
+        session.close()
+
+
+@job_handler("analytics.rfm")
+def compute_customer_segments(db: Session, payloads: List[dict]):
+    session = SessionLocal()
+    try:
+        customer_analytics.compute_segments(session)
+    finally:
+        session.close()
+
+
+schedule("retention.purge", retention.PURGE_INTERVAL)
+schedule("partitions.maintain", timedelta(days=1))
+schedule("analytics.rfm", timedelta(days=1))
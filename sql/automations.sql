@@ -1,14 +1,22 @@
 CREATE OR REPLACE FUNCTION update_order_total()
 RETURNS TRIGGER AS $$
+DECLARE
+    item RECORD;
 BEGIN
+    IF TG_OP = 'DELETE' THEN
+        item := OLD;
+    ELSE
+        item := NEW;
+    END IF;
+    -- Matching on order_date as well keeps both lookups to a single partition
     UPDATE orders
     SET total_amount = (
         SELECT COALESCE(SUM(quantity * price_at_order), 0)
         FROM order_items
-        WHERE order_id = NEW.order_id
+        WHERE order_id = item.order_id AND order_date = item.order_date
     )
-    WHERE id = NEW.order_id;
-    RETURN NEW;
+    WHERE id = item.order_id AND order_date = item.order_date;
+    RETURN NULL;
 END;
 $$ LANGUAGE plpgsql;
 
@@ -58,8 +66,14 @@ EXECUTE FUNCTION create_cart_after_user();
 CREATE OR REPLACE FUNCTION create_welcome_notification()
 RETURNS TRIGGER AS $$
 BEGIN
-    INSERT INTO notifications(user_id, title, message)
-    VALUES (NEW.id, 'Welcome!', 'Thanks for joining CandleShop!');
+    -- Delivered by the background job workers, batched with other notifications
+    -- run_at is compared with UTC by the workers, whatever the session time zone
+    INSERT INTO jobs(type, payload, run_at)
+    VALUES ('notifications.create', jsonb_build_object(
+        'user_id', NEW.id,
+        'title', 'Welcome!',
+        'message', 'Thanks for joining CandleShop!'
+    ), now() AT TIME ZONE 'utc');
     RETURN NEW;
 END;
 $$ LANGUAGE plpgsql;
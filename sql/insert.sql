@@ -45,10 +45,13 @@ INSERT INTO orders (user_id, status, total_amount)
 VALUES 
 (1, 'pending', 39.98),
 (2, 'shipped', 19.99);
-INSERT INTO order_items (order_id, candle_id, quantity, price_at_order)
-VALUES 
+INSERT INTO order_items (order_id, order_date, candle_id, quantity, price_at_order)
+SELECT o.id, o.order_date, v.candle_id, v.quantity, v.price_at_order
+FROM (VALUES
 (1, 1, 2, 19.99),
-(2, 2, 1, 19.99);
+(2, 2, 1, 19.99)
+) AS v(order_id, candle_id, quantity, price_at_order)
+JOIN orders o ON o.id = v.order_id;
 INSERT INTO reviews (user_id, candle_id, rating, comment)
 VALUES 
 (1, 1, 5, 'Loved the scent! Highly recommended.'),
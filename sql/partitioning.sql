@@ -0,0 +1,56 @@
+-- Optional: convert notifications and user_tokens to monthly range partitions on created_at.
+-- Run after tables.sql and automations.sql. Retention purges then drop whole months
+-- instead of deleting rows, and queries bounded on created_at only scan recent months.
+BEGIN;
+
+ALTER TABLE notifications RENAME TO notifications_unpartitioned;
+CREATE TABLE notifications (
+    id INT NOT NULL DEFAULT nextval('notifications_id_seq'),
+    user_id INT REFERENCES users(id) ON DELETE CASCADE,
+    title VARCHAR(150),
+    message TEXT,
+    is_read BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE notifications_default PARTITION OF notifications DEFAULT;
+CREATE INDEX idx_notifications_part_created_at ON notifications (created_at);
+CREATE INDEX idx_notifications_part_user ON notifications (user_id, created_at);
+SELECT create_monthly_partitions(
+    'notifications',
+    COALESCE((SELECT MIN(created_at) FROM notifications_unpartitioned), CURRENT_DATE)::DATE,
+    3
+);
+INSERT INTO notifications (id, user_id, title, message, is_read, created_at)
+SELECT id, user_id, title, message, is_read, COALESCE(created_at, CURRENT_TIMESTAMP)
+FROM notifications_unpartitioned;
+ALTER SEQUENCE notifications_id_seq OWNED BY notifications.id;
+DROP TABLE notifications_unpartitioned;
+
+ALTER TABLE user_tokens RENAME TO user_tokens_unpartitioned;
+CREATE TABLE user_tokens (
+    id INT NOT NULL DEFAULT nextval('user_tokens_id_seq'),
+    user_id INT REFERENCES users(id) ON DELETE CASCADE,
+    token TEXT NOT NULL,
+    type VARCHAR(50), -- 'password_reset', 'email_verification'
+    is_used BOOLEAN DEFAULT FALSE,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP,
+    PRIMARY KEY (id, created_at)
+) PARTITION BY RANGE (created_at);
+CREATE TABLE user_tokens_default PARTITION OF user_tokens DEFAULT;
+CREATE INDEX idx_user_tokens_part_created_at ON user_tokens (created_at);
+CREATE INDEX idx_user_tokens_part_used ON user_tokens (created_at) WHERE is_used IS TRUE;
+CREATE INDEX idx_user_tokens_part_expires_at ON user_tokens (expires_at);
+SELECT create_monthly_partitions(
+    'user_tokens',
+    COALESCE((SELECT MIN(created_at) FROM user_tokens_unpartitioned), CURRENT_DATE)::DATE,
+    3
+);
+INSERT INTO user_tokens (id, user_id, token, type, is_used, created_at, expires_at)
+SELECT id, user_id, token, type, is_used, COALESCE(created_at, CURRENT_TIMESTAMP), expires_at
+FROM user_tokens_unpartitioned;
+ALTER SEQUENCE user_tokens_id_seq OWNED BY user_tokens.id;
+DROP TABLE user_tokens_unpartitioned;
+
+COMMIT;
@@ -6,6 +6,7 @@ CREATE TABLE categories (
 
 CREATE TABLE candles (
     id SERIAL PRIMARY KEY,
+    sku VARCHAR(64) UNIQUE, -- supplier SKU, the upsert key for catalog imports
     name VARCHAR(150) NOT NULL,
     description TEXT,
     price DECIMAL(10, 2) NOT NULL,
@@ -24,9 +25,14 @@ CREATE TABLE candle_images (
     id SERIAL PRIMARY KEY,
     candle_id INT REFERENCES candles(id) ON DELETE CASCADE,
     image_url TEXT NOT NULL,
-    alt_text VARCHAR(150)
+    alt_text VARCHAR(150),
+    content_hash CHAR(64),
+    variants JSONB,
+    UNIQUE (candle_id, image_url)
 );
 
+CREATE INDEX idx_candle_images_content_hash ON candle_images (content_hash);
+
 CREATE TABLE tags (
     id SERIAL PRIMARY KEY,
     name VARCHAR(50) UNIQUE NOT NULL
@@ -57,7 +63,7 @@ CREATE TABLE carts (
 CREATE TABLE cart_items (
     id SERIAL PRIMARY KEY,
     cart_id INT REFERENCES carts(id) ON DELETE CASCADE,
-    candle_id INT REFERENCES candles(id),
+    candle_id INT REFERENCES candles(id) ON DELETE CASCADE,
     quantity INT NOT NULL CHECK (quantity > 0)
 );
 CREATE TABLE wishlists (
@@ -65,25 +71,108 @@ CREATE TABLE wishlists (
     candle_id INT REFERENCES candles(id) ON DELETE CASCADE,
     PRIMARY KEY (user_id, candle_id)
 );
+-- Monthly range partition helpers, used by orders below and by sql/partitioning.sql
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, from_date DATE, months_ahead INT)
+RETURNS INT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_date);
+    last_month DATE := date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead);
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(parent)) THEN
+        RETURN 0;
+    END IF;
+    WHILE month_start <= last_month LOOP
+        partition_name := parent || '_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, parent, month_start, month_start + INTERVAL '1 month'
+            );
+            created := created + 1;
+        END IF;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Drops the monthly partitions of parent whose whole range is older than cutoff
+CREATE OR REPLACE FUNCTION drop_partitions_before(parent TEXT, cutoff TIMESTAMP)
+RETURNS INT AS $$
+DECLARE
+    part RECORD;
+    dropped INT := 0;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(parent)
+          AND c.relname ~ ('^' || parent || '_[0-9]{4}_[0-9]{2}$')
+    LOOP
+        IF to_date(right(part.relname, 7), 'YYYY_MM') + INTERVAL '1 month' <= cutoff THEN
+            EXECUTE format('DROP TABLE %I', part.relname);
+            dropped := dropped + 1;
+        END IF;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Orders and their items are partitioned by month of order_date. The partition key has to be
+-- part of every unique key, so order_items carries order_date and references (id, order_date).
 CREATE TABLE orders (
-    id SERIAL PRIMARY KEY,
-    user_id INT REFERENCES users(id),
+    id SERIAL,
+    user_id INT REFERENCES users(id) ON DELETE CASCADE,
     status VARCHAR(50) DEFAULT 'pending',
-    order_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    total_amount DECIMAL(10,2)
-);
+    order_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    total_amount DECIMAL(10,2),
+    PRIMARY KEY (id, order_date)
+) PARTITION BY RANGE (order_date);
+CREATE TABLE orders_default PARTITION OF orders DEFAULT;
+CREATE INDEX idx_orders_order_date ON orders (order_date DESC, id DESC);
+CREATE INDEX idx_orders_id ON orders (id);
+CREATE INDEX idx_orders_user ON orders (user_id, order_date DESC, id DESC);
 
 CREATE TABLE order_items (
-    id SERIAL PRIMARY KEY,
-    order_id INT REFERENCES orders(id) ON DELETE CASCADE,
+    id SERIAL,
+    order_id INT NOT NULL,
+    order_date TIMESTAMP NOT NULL,
     candle_id INT REFERENCES candles(id),
     quantity INT NOT NULL,
-    price_at_order DECIMAL(10,2) NOT NULL
-);
+    price_at_order DECIMAL(10,2) NOT NULL,
+    PRIMARY KEY (id, order_date),
+    FOREIGN KEY (order_id, order_date) REFERENCES orders(id, order_date) ON DELETE CASCADE
+) PARTITION BY RANGE (order_date);
+CREATE TABLE order_items_default PARTITION OF order_items DEFAULT;
+CREATE INDEX idx_order_items_order ON order_items (order_id);
+CREATE INDEX idx_order_items_candle ON order_items (candle_id, order_date);
+
+CREATE INDEX idx_orders_status ON orders (status);
+-- Fulfilment queue: open orders, oldest first
+CREATE INDEX idx_orders_open ON orders (order_date, id) WHERE status IN ('pending', 'processing');
+
+CREATE TABLE order_status_transitions (
+    from_status VARCHAR(50),
+    to_status VARCHAR(50),
+    PRIMARY KEY (from_status, to_status)
+);
+INSERT INTO order_status_transitions (from_status, to_status) VALUES
+('pending', 'processing'),
+('pending', 'shipped'),
+('pending', 'cancelled'),
+('processing', 'shipped'),
+('processing', 'cancelled'),
+('shipped', 'delivered');
+
+SELECT create_monthly_partitions('orders', CURRENT_DATE, 3);
+SELECT create_monthly_partitions('order_items', CURRENT_DATE, 3);
 CREATE TABLE reviews (
     id SERIAL PRIMARY KEY,
-    user_id INT REFERENCES users(id),
-    candle_id INT REFERENCES candles(id),
+    user_id INT REFERENCES users(id) ON DELETE CASCADE,
+    candle_id INT REFERENCES candles(id) ON DELETE CASCADE,
     rating INT CHECK (rating BETWEEN 1 AND 5),
     comment TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
@@ -124,3 +213,42 @@ CREATE TABLE user_tokens (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     expires_at TIMESTAMP
 );
+CREATE INDEX idx_notifications_created_at ON notifications (created_at);
+CREATE INDEX idx_user_tokens_created_at ON user_tokens (created_at);
+-- The early purge conditions for used and expired tokens (app/retention.py)
+CREATE INDEX idx_user_tokens_used ON user_tokens (created_at) WHERE is_used IS TRUE;
+CREATE INDEX idx_user_tokens_expires_at ON user_tokens (expires_at);
+CREATE TABLE jobs (
+    id BIGSERIAL PRIMARY KEY,
+    type VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- pending / running / failed, finished jobs are deleted
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'), -- UTC, like datetime.utcnow() in app/jobs.py
+    last_error TEXT,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+-- run_at of a running job is the end of its lease
+CREATE INDEX idx_jobs_ready ON jobs (run_at) WHERE status IN ('pending', 'running');
+CREATE INDEX idx_jobs_type_ready ON jobs (type, run_at) WHERE status IN ('pending', 'running');
+CREATE TABLE customer_segments (
+    user_id INT PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    recency_days INT NOT NULL, -- days since the last order
+    frequency INT NOT NULL, -- orders in the last 365 days
+    monetary DECIMAL(12,2) NOT NULL, -- spend in the last 365 days
+    lifetime_value DECIMAL(12,2) NOT NULL, -- spend over all non-cancelled orders
+    r_score INT NOT NULL, -- 1 (worst) to 5 (best)
+    f_score INT NOT NULL,
+    m_score INT NOT NULL,
+    segment VARCHAR(30) NOT NULL,
+    first_order_at TIMESTAMP,
+    last_order_at TIMESTAMP,
+    computed_at TIMESTAMP NOT NULL
+);
+-- One per sort of the admin user list (USER_SORTS in app/routes/admin_routes.py)
+CREATE INDEX idx_customer_segments_segment ON customer_segments (segment, lifetime_value DESC, user_id);
+CREATE INDEX idx_customer_segments_lifetime_value ON customer_segments (lifetime_value DESC, user_id);
+CREATE INDEX idx_customer_segments_monetary ON customer_segments (monetary DESC, user_id);
+CREATE INDEX idx_customer_segments_frequency ON customer_segments (frequency DESC, user_id);
+CREATE INDEX idx_customer_segments_recency ON customer_segments (recency_days, user_id);
@@ -0,0 +1,169 @@
+-- Brings a database created from an earlier tables.sql up to the current schema.
+-- Run once, after backing up. Tables that are new rather than changed can be created
+-- from their definitions in tables.sql.
+BEGIN;
+
+-- Monthly range partition helpers, the same as in tables.sql
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent TEXT, from_date DATE, months_ahead INT)
+RETURNS INT AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_date);
+    last_month DATE := date_trunc('month', CURRENT_DATE) + make_interval(months => months_ahead);
+    partition_name TEXT;
+    created INT := 0;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(parent)) THEN
+        RETURN 0;
+    END IF;
+    WHILE month_start <= last_month LOOP
+        partition_name := parent || '_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format(
+                'CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, parent, month_start, month_start + INTERVAL '1 month'
+            );
+            created := created + 1;
+        END IF;
+        month_start := month_start + INTERVAL '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION drop_partitions_before(parent TEXT, cutoff TIMESTAMP)
+RETURNS INT AS $$
+DECLARE
+    part RECORD;
+    dropped INT := 0;
+BEGIN
+    FOR part IN
+        SELECT c.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(parent)
+          AND c.relname ~ ('^' || parent || '_[0-9]{4}_[0-9]{2}$')
+    LOOP
+        IF to_date(right(part.relname, 7), 'YYYY_MM') + INTERVAL '1 month' <= cutoff THEN
+            EXECUTE format('DROP TABLE %I', part.relname);
+            dropped := dropped + 1;
+        END IF;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql;
+
+-- orders and order_items: monthly partitions on order_date. Items get their order's
+-- order_date so they can reference (id, order_date); items without an order are dropped.
+UPDATE orders SET order_date = CURRENT_TIMESTAMP WHERE order_date IS NULL;
+ALTER TABLE order_items RENAME TO order_items_unpartitioned;
+ALTER TABLE orders RENAME TO orders_unpartitioned;
+ALTER TABLE orders_unpartitioned RENAME CONSTRAINT orders_pkey TO orders_unpartitioned_pkey;
+ALTER TABLE order_items_unpartitioned RENAME CONSTRAINT order_items_pkey TO order_items_unpartitioned_pkey;
+
+CREATE TABLE orders (
+    id INT NOT NULL DEFAULT nextval('orders_id_seq'),
+    user_id INT REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(50) DEFAULT 'pending',
+    order_date TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    total_amount DECIMAL(10,2),
+    PRIMARY KEY (id, order_date)
+) PARTITION BY RANGE (order_date);
+CREATE TABLE orders_default PARTITION OF orders DEFAULT;
+CREATE INDEX idx_orders_order_date ON orders (order_date DESC, id DESC);
+CREATE INDEX idx_orders_id ON orders (id);
+CREATE INDEX idx_orders_user ON orders (user_id, order_date DESC, id DESC);
+CREATE INDEX idx_orders_status ON orders (status);
+CREATE INDEX idx_orders_open ON orders (order_date, id) WHERE status IN ('pending', 'processing');
+
+CREATE TABLE order_items (
+    id INT NOT NULL DEFAULT nextval('order_items_id_seq'),
+    order_id INT NOT NULL,
+    order_date TIMESTAMP NOT NULL,
+    candle_id INT REFERENCES candles(id),
+    quantity INT NOT NULL,
+    price_at_order DECIMAL(10,2) NOT NULL,
+    PRIMARY KEY (id, order_date),
+    FOREIGN KEY (order_id, order_date) REFERENCES orders(id, order_date) ON DELETE CASCADE
+) PARTITION BY RANGE (order_date);
+CREATE TABLE order_items_default PARTITION OF order_items DEFAULT;
+CREATE INDEX idx_order_items_order ON order_items (order_id);
+CREATE INDEX idx_order_items_candle ON order_items (candle_id, order_date);
+
+SELECT create_monthly_partitions(
+    'orders',
+    COALESCE((SELECT MIN(order_date) FROM orders_unpartitioned), CURRENT_DATE)::DATE,
+    3
+);
+SELECT create_monthly_partitions(
+    'order_items',
+    COALESCE((SELECT MIN(order_date) FROM orders_unpartitioned), CURRENT_DATE)::DATE,
+    3
+);
+INSERT INTO orders (id, user_id, status, order_date, total_amount)
+SELECT id, user_id, status, order_date, total_amount
+FROM orders_unpartitioned;
+INSERT INTO order_items (id, order_id, order_date, candle_id, quantity, price_at_order)
+SELECT i.id, i.order_id, o.order_date, i.candle_id, i.quantity, i.price_at_order
+FROM order_items_unpartitioned i
+JOIN orders_unpartitioned o ON o.id = i.order_id;
+ALTER SEQUENCE orders_id_seq OWNED BY orders.id;
+ALTER SEQUENCE order_items_id_seq OWNED BY order_items.id;
+DROP TABLE order_items_unpartitioned;
+DROP TABLE orders_unpartitioned;
+
+-- The old trigger went with the old order_items; this is the function from automations.sql
+CREATE OR REPLACE FUNCTION update_order_total()
+RETURNS TRIGGER AS $$
+DECLARE
+    item RECORD;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        item := OLD;
+    ELSE
+        item := NEW;
+    END IF;
+    -- Matching on order_date as well keeps both lookups to a single partition
+    UPDATE orders
+    SET total_amount = (
+        SELECT COALESCE(SUM(quantity * price_at_order), 0)
+        FROM order_items
+        WHERE order_id = item.order_id AND order_date = item.order_date
+    )
+    WHERE id = item.order_id AND order_date = item.order_date;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_update_order_total
+AFTER INSERT OR UPDATE OR DELETE ON order_items
+FOR EACH ROW
+EXECUTE FUNCTION update_order_total();
+
+-- Catalog imports upsert candles on sku and skip images a candle already has
+ALTER TABLE candles ADD COLUMN sku VARCHAR(64) UNIQUE;
+DELETE FROM candle_images a
+USING candle_images b
+WHERE a.candle_id = b.candle_id AND a.image_url = b.image_url AND a.id > b.id;
+ALTER TABLE candle_images ADD UNIQUE (candle_id, image_url);
+
+-- Deleting a candle or user cascades in the database; orders.user_id already does above
+ALTER TABLE cart_items
+    DROP CONSTRAINT cart_items_candle_id_fkey,
+    ADD CONSTRAINT cart_items_candle_id_fkey FOREIGN KEY (candle_id) REFERENCES candles(id) ON DELETE CASCADE;
+ALTER TABLE reviews
+    DROP CONSTRAINT reviews_user_id_fkey,
+    ADD CONSTRAINT reviews_user_id_fkey FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE,
+    DROP CONSTRAINT reviews_candle_id_fkey,
+    ADD CONSTRAINT reviews_candle_id_fkey FOREIGN KEY (candle_id) REFERENCES candles(id) ON DELETE CASCADE;
+
+-- Uploaded images are stored by content hash, with their resized variants
+ALTER TABLE candle_images ADD COLUMN content_hash CHAR(64), ADD COLUMN variants JSONB;
+CREATE INDEX idx_candle_images_content_hash ON candle_images (content_hash);
+
+-- Retention purges and the created_at >= retention_cutoff(...) filters on notification and token listings
+CREATE INDEX idx_notifications_created_at ON notifications (created_at);
+CREATE INDEX idx_user_tokens_created_at ON user_tokens (created_at);
+CREATE INDEX idx_user_tokens_used ON user_tokens (created_at) WHERE is_used IS TRUE;
+CREATE INDEX idx_user_tokens_expires_at ON user_tokens (expires_at);
+
+COMMIT;
@@ -0,0 +1,112 @@
+"""?expand= loads relations with a fixed number of queries, whatever the page size."""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, get_db
+from app.dependencies import API_KEY
+from app.models.product import Candle, CandleImage, Category, Tag, candle_tags
+from app.routes import admin_routes, user_routes
+
+CANDLES = 50
+
+
+@compiles(JSONB, "sqlite")
+def _jsonb_on_sqlite(type_, compiler, **kw):
+    return "JSON"
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine, tables=[
+        Category.__table__, Candle.__table__, CandleImage.__table__, Tag.__table__, candle_tags,
+    ])
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        categories = [Category(name=f"category {i}") for i in range(3)]
+        tags = [Tag(name=f"tag {i}") for i in range(4)]
+        for i in range(CANDLES):
+            db.add(Candle(
+                name=f"candle {i}", price=10, stock_quantity=5,
+                category=categories[i % 3],
+                tags=[tags[i % 4], tags[(i + 1) % 4]],
+                images=[CandleImage(image_url=f"/img/{i}-{n}.jpg") for n in range(2)],
+            ))
+        db.commit()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def client(engine):
+    Session = sessionmaker(bind=engine)
+
+    def override_get_db():
+        db = Session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app = FastAPI()
+    app.include_router(user_routes.router, prefix="/user/candles")
+    app.include_router(admin_routes.router, prefix="/admin/candles")
+    app.dependency_overrides[get_db] = override_get_db
+    return TestClient(app)
+
+
+@pytest.fixture
+def statements(engine):
+    seen = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        seen.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield seen
+    event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.mark.parametrize("limit", [1, 10, CANDLES])
+def test_admin_list_expand_query_count(client, statements, limit):
+    response = client.get(
+        "/admin/candles/v2/",
+        params={"limit": limit, "expand": "images,tags,category"},
+        headers={"X-API-Key": API_KEY},
+    )
+    assert response.status_code == 200
+    candles = response.json()
+    assert len(candles) == limit
+    assert all(len(c["images"]) == 2 and len(c["tags"]) == 2 and c["category"] for c in candles)
+    # Candles joined with their category, then one query each for images and tags
+    assert len(statements) == 3
+
+
+@pytest.mark.parametrize("limit", [1, 10, CANDLES])
+def test_admin_list_without_expand_is_one_query(client, statements, limit):
+    response = client.get("/admin/candles/v2/", params={"limit": limit}, headers={"X-API-Key": API_KEY})
+    assert response.status_code == 200
+    candles = response.json()
+    assert len(candles) == limit
+    assert all(c["images"] is None and c["tags"] is None and c["category"] is None for c in candles)
+    assert len(statements) == 1
+
+
+def test_user_list_expand_query_count(client, statements):
+    response = client.get("/user/candles/v2/", params={"expand": "images,tags"})
+    assert response.status_code == 200
+    candles = response.json()
+    assert len(candles) == CANDLES
+    assert all(len(c["images"]) == 2 and len(c["tags"]) == 2 and c["category"] is None for c in candles)
+    assert len(statements) == 3
+
+
+def test_unknown_expand_field_is_rejected(client):
+    response = client.get("/user/candles/v2/", params={"expand": "reviews"})
+    assert response.status_code == 400
@@ -0,0 +1,35 @@
+"""RFM scoring and segment rules on plain NumPy arrays."""
+import numpy as np
+
+from app.customer_analytics import DEFAULT_SEGMENT, quantile_scores, segment_labels
+
+
+def test_quantile_scores_spread_distinct_values_over_five_bins():
+    assert quantile_scores(np.arange(10)).tolist() == [1, 1, 2, 2, 3, 3, 4, 4, 5, 5]
+    assert quantile_scores(np.arange(10), higher_is_better=False).tolist() == [5, 5, 4, 4, 3, 3, 2, 2, 1, 1]
+
+
+def test_quantile_scores_give_ties_one_score():
+    # Most customers have a single order; they all share the middle score, not the lowest
+    assert quantile_scores(np.ones(10)).tolist() == [3] * 10
+    frequency = np.array([1, 1, 1, 1, 1, 1, 1, 1, 2, 5])
+    assert quantile_scores(frequency).tolist() == [3] * 8 + [5, 5]
+
+
+def test_new_segment_uses_the_raw_order_count():
+    r = np.array([5, 4, 5, 2])
+    f = np.array([3, 3, 3, 3])
+    m = np.array([2, 2, 2, 2])
+    orders = np.array([1, 1, 2, 1])
+    # Only recent customers with a single order are new, whatever their tied f score
+    assert segment_labels(r, f, m, orders).tolist() == ["new", "new", "potential_loyalist", "at_risk"]
+
+
+def test_segment_rules_first_match_wins():
+    r = np.array([5, 1, 3, 1, 3])
+    f = np.array([5, 5, 4, 1, 1])
+    m = np.array([5, 5, 1, 1, 1])
+    orders = np.array([9, 9, 6, 1, 1])
+    assert segment_labels(r, f, m, orders).tolist() == [
+        "champions", "cant_lose", "loyal", "lost", DEFAULT_SEGMENT,
+    ]
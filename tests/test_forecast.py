@@ -0,0 +1,56 @@
+"""Stock forecast maths on NumPy arrays, including the 100k SKU time budget."""
+import time
+
+import numpy as np
+
+from app.forecast import sales_matrix, stock_risk
+
+SKUS = 100_000
+WINDOW_DAYS = 28
+
+
+def test_sales_matrix_sums_sales_per_candle_and_day():
+    candle_ids = np.array([3, 5, 9])
+    sales = sales_matrix(
+        candle_ids,
+        sold_ids=np.array([5, 5, 9, 4, 3]),
+        day_index=np.array([0, 0, 2, 1, 3]),
+        quantities=np.array([1.0, 2.0, 4.0, 7.0, 5.0]),
+        window_days=3,
+    )
+    # Unknown candles (4) and days outside the window (3) are dropped
+    assert sales.tolist() == [[0, 0, 0], [3, 0, 0], [0, 0, 4]]
+
+
+def test_sales_matrix_without_sales():
+    assert sales_matrix(np.array([1, 2]), np.array([]), np.array([]), np.array([]), 4).shape == (2, 4)
+
+
+def test_stock_risk_orders_soonest_stockout_first():
+    stock = np.array([100.0, 10.0, 5.0, 0.0])
+    sales = np.array([[1.0, 1.0], [2.0, 2.0], [5.0, 5.0], [0.0, 0.0]])
+    demand, days_of_cover, reorder_point, at_risk = stock_risk(
+        stock, sales, horizon_days=7, lead_time_days=2, service_level_z=1.65
+    )
+    assert demand.tolist() == [1, 2, 5, 0]
+    assert days_of_cover.tolist() == [100, 5, 1, np.inf]
+    assert reorder_point.tolist() == [2, 4, 10, 0]
+    assert at_risk.tolist() == [2, 1]
+
+
+def test_100k_skus_well_under_a_second():
+    rng = np.random.default_rng(0)
+    candle_ids = np.arange(1, SKUS + 1)
+    sales_rows = SKUS * 5
+    sold_ids = rng.integers(1, SKUS + 1, sales_rows)
+    day_index = rng.integers(0, WINDOW_DAYS, sales_rows)
+    quantities = rng.integers(1, 5, sales_rows).astype(np.float64)
+    stock = rng.integers(0, 200, SKUS).astype(np.float64)
+
+    started = time.perf_counter()
+    sales = sales_matrix(candle_ids, sold_ids, day_index, quantities, WINDOW_DAYS)
+    stock_risk(stock, sales, horizon_days=14, lead_time_days=7, service_level_z=1.65)
+    elapsed = time.perf_counter() - started
+
+    assert sales.sum() == quantities.sum()
+    assert elapsed < 0.5
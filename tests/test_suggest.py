@@ -0,0 +1,104 @@
+"""In-memory prefix index behind /suggest/."""
+from types import SimpleNamespace
+
+import pytest
+
+from app import suggest
+from app.suggest import SuggestIndex
+
+
+def texts(results):
+    return [result["text"] for result in results]
+
+
+@pytest.fixture
+def index(monkeypatch):
+    terms = {
+        ("candle", 1): {"text": "Vanilla Dream", "popularity": 5.0},
+        ("candle", 2): {"text": "Vanilla Bean", "popularity": 20.0},
+        ("candle", 3): {"text": "Sea Breeze", "popularity": 1.0},
+        ("scent", "vanilla"): {"text": "Vanilla", "popularity": 25.0},
+        ("tag", 7): {"text": "dreamy", "popularity": 2.0},
+    }
+    monkeypatch.setattr(suggest, "load_terms", lambda db: {key: dict(term) for key, term in terms.items()})
+    index = SuggestIndex()
+    index.rebuild(db=None)
+    return index
+
+
+def test_matches_any_word_start(index):
+    assert texts(index.suggest("dre")) == ["Vanilla Dream", "dreamy"]
+    assert texts(index.suggest("bre")) == ["Sea Breeze"]
+    # Inside a word is not a word start
+    assert index.suggest("anilla") == []
+
+
+def test_prefix_is_normalized(index):
+    assert texts(index.suggest("  VANILLA-dr")) == ["Vanilla Dream"]
+    assert index.suggest("   ") == []
+
+
+def test_ranked_by_popularity_and_limited(index):
+    assert texts(index.suggest("van")) == ["Vanilla", "Vanilla Bean", "Vanilla Dream"]
+    assert texts(index.suggest("van", limit=2)) == ["Vanilla", "Vanilla Bean"]
+
+
+def test_results_carry_kind_and_id(index):
+    assert index.suggest("sea") == [{"text": "Sea Breeze", "kind": "candle", "id": 3}]
+    assert index.suggest("vanilla", limit=1) == [{"text": "Vanilla", "kind": "scent", "id": None}]
+
+
+def test_set_term_invalidates_cached_results(index):
+    assert texts(index.suggest("sea")) == ["Sea Breeze"]
+    index.set_term(("candle", 3), "Ocean Breeze")
+    assert index.suggest("sea") == []
+    assert texts(index.suggest("oce")) == ["Ocean Breeze"]
+    # Renaming keeps the popularity the term had
+    index.set_term(("candle", 4), "Ocean Mist", popularity=0.5)
+    assert texts(index.suggest("oce")) == ["Ocean Breeze", "Ocean Mist"]
+
+
+def test_remove_term_invalidates_cached_results(index):
+    assert texts(index.suggest("dre")) == ["Vanilla Dream", "dreamy"]
+    index.remove_term(("tag", 7))
+    assert texts(index.suggest("dre")) == ["Vanilla Dream"]
+    index.remove_term(("tag", 99))
+
+
+def test_update_and_remove_candle(index):
+    index.update_candle(SimpleNamespace(id=5, name="Cedar Smoke", scent="Cedarwood"))
+    assert sorted(texts(index.suggest("ced"))) == ["Cedar Smoke", "Cedarwood"]
+    index.remove_candle(5)
+    # The scent may belong to other candles too, so it stays until the next rebuild
+    assert texts(index.suggest("ced")) == ["Cedarwood"]
+
+
+def test_rebuild_replaces_in_place_changes(index):
+    index.set_term(("candle", 3), "Ocean Breeze")
+    index.mark_stale()
+    assert index.needs_rebuild()
+    index.rebuild(db=None)
+    assert not index.needs_rebuild()
+    assert texts(index.suggest("sea")) == ["Sea Breeze"]
+    assert index.suggest("oce") == []
+
+
+def test_needs_rebuild_when_old(index, monkeypatch):
+    assert not index.needs_rebuild()
+    now = suggest.time.monotonic()
+    monkeypatch.setattr(suggest.time, "monotonic", lambda: now + suggest.SUGGEST_MAX_AGE_SECONDS + 1)
+    assert index.needs_rebuild()
+
+
+def test_ensure_built_loads_once(monkeypatch):
+    loads = []
+    monkeypatch.setattr(suggest, "SessionLocal", lambda: SimpleNamespace(close=lambda: None))
+    monkeypatch.setattr(suggest, "load_terms", lambda db: loads.append(db) or {
+        ("tag", 1): {"text": "woody", "popularity": 1.0},
+    })
+    index = SuggestIndex()
+    assert not index.ready and index.needs_rebuild()
+    index.ensure_built()
+    index.ensure_built()
+    assert len(loads) == 1
+    assert texts(index.suggest("wo")) == ["woody"]